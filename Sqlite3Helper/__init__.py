@@ -1,18 +1,53 @@
 # coding: utf8
+from typing import TYPE_CHECKING
+
 from ._crypto import generate_key_and_stuff
 from ._types_def import (
     DataType, NullType, BlobType,
 )
 from ._column import Column, Table
 from ._where import (
-    Operand, Expression, SortOption, NullOption, order
+    Operand, Expression, SortOption, NullOption, order, Aggregate
 )
+from ._join import Join
+from ._index import QueryPlanStep, IndexAdvice
+from ._columnar import ColumnArray
+from ._cache import ResultCache
+from ._schema import ColumnInfo, IndexInfo
 from ._worker import Sqlite3Worker
 
+if TYPE_CHECKING:
+    from ._transfer import TransferReport
+    from ._pool import Sqlite3WorkerPool
+    from ._shard import ShardedSqlite3Worker
+    from ._async import AsyncSqlite3Worker
+
 
 __version__ = "2.3.0"
 __version_info__ = tuple(map(int, __version__.split(".")))
 
+# 按需导入的几个类不放在 __all__ 中，否则 from Sqlite3Helper import * 会把它们全部导入，
+# 需要时单独导入，比如 from Sqlite3Helper import Sqlite3WorkerPool
 __all__ = ["Sqlite3Worker", "Column", "DataType", "NullType", "BlobType",
-           "Operand", "Expression", "SortOption", "NullOption", "order",
-           "generate_key_and_stuff", "Table"]
+           "Operand", "Expression", "SortOption", "NullOption", "order", "Aggregate",
+           "generate_key_and_stuff", "Table", "Join", "QueryPlanStep", "IndexAdvice",
+           "ColumnArray", "ResultCache", "ColumnInfo", "IndexInfo"]
+
+
+# 这些类用到时才导入模块：asyncio 、线程池、csv 和 json 的导入都比较慢
+_LAZY_ATTRS = {
+    "AsyncSqlite3Worker": "._async",
+    "Sqlite3WorkerPool": "._pool",
+    "ShardedSqlite3Worker": "._shard",
+    "TransferReport": "._transfer",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,229 @@
+# coding: utf8
+from __future__ import annotations
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections.abc import AsyncIterator, Callable
+from itertools import islice
+from os import PathLike
+from typing import Any
+
+from ._column import Table
+from ._index import QueryPlanStep
+from ._schema import ColumnInfo, IndexInfo
+from ._transfer import TransferReport
+from ._worker import Sqlite3Worker
+from ._pool import Sqlite3WorkerPool
+
+
+class AsyncSqlite3Worker(object):
+    """
+    Sqlite3Worker 的 asyncio 版本，所有操作在一个专门的连接线程中按提交顺序执行，
+    不会阻塞事件循环，同时 await 的多个调用会排队依次执行。
+    readers 大于 0 时，select 由若干只读连接并行执行，此时数据库必须是文件。
+    """
+
+    def __init__(
+            self,
+            db_name: str | PathLike[str] = ":memory:",
+            key: bytes = None,
+            fix_time: int = None,
+            fix_iv: bytes = None,
+            *,
+            readers: int = 0,
+            **worker_options,
+    ):
+        self._is_closed = True
+        # 连接线程和只读连接必须使用相同的 fix_time 和 fix_iv
+        if key is not None:
+            fix_time = fix_time if fix_time is not None else int(time.time())
+            fix_iv = fix_iv if fix_iv is not None else os.urandom(16)
+
+        self._db_name = db_name
+        self._pool = None
+        self._reader_executor = None
+        if readers > 0:
+            self._pool = Sqlite3WorkerPool(db_name, key, fix_time, fix_iv, readers=readers, **worker_options)
+            self._reader_executor = ThreadPoolExecutor(readers, thread_name_prefix="Sqlite3Helper-reader")
+
+        self._queue = queue.Queue()
+        self._worker: Sqlite3Worker | None = None
+        started = Future()
+        self._thread = threading.Thread(
+            target=self._run, args=(started, db_name, key, fix_time, fix_iv, worker_options),
+            name="Sqlite3Helper-connection", daemon=True,
+        )
+        self._thread.start()
+        # 等待连接建立，参数有误时在这里抛出
+        started.result()
+        self._is_closed = False
+
+    def _run(self, started: Future, db_name, key, fix_time, fix_iv, worker_options: dict):
+        try:
+            if self._pool is not None:
+                # 写连接允许跨线程使用，之后只有本线程会用到它
+                self._worker = self._pool._writer
+            else:
+                self._worker = Sqlite3Worker(db_name, key, fix_time, fix_iv, **worker_options)
+        except BaseException as e:
+            started.set_exception(e)
+            return
+        started.set_result(None)
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            func, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(self._worker))
+            except BaseException as e:
+                future.set_exception(e)
+
+        if self._pool is None:
+            self._worker.close()
+
+    def _submit(self, func: Callable[[Sqlite3Worker], Any]) -> Future:
+        if self._is_closed:
+            raise ValueError("Worker is closed")
+        future = Future()
+        self._queue.put((func, future))
+        return future
+
+    async def run(self, func: Callable[[Sqlite3Worker], Any]) -> Any:
+        """
+        在连接线程中执行 func(worker)，func 中的多个操作之间不会插入其他调用，
+        可用于执行事务：await aw.run(lambda w: ...)
+        """
+        return await asyncio.wrap_future(self._submit(func))
+
+    @property
+    def db_name(self) -> str:
+        return self._db_name
+
+    async def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        if self._pool is not None:
+            self._reader_executor.shutdown()
+            self._pool.close()
+
+    async def __aenter__(self) -> AsyncSqlite3Worker:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def commit(self):
+        return await self.run(lambda w: w.commit())
+
+    async def create_table(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.create_table(*args, **kwargs))
+
+    async def drop_table(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.drop_table(*args, **kwargs))
+
+    async def rename_table(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.rename_table(*args, **kwargs))
+
+    async def add_column(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.add_column(*args, **kwargs))
+
+    async def rename_column(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.rename_column(*args, **kwargs))
+
+    async def create_index(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.create_index(*args, **kwargs))
+
+    async def drop_index(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.drop_index(*args, **kwargs))
+
+    async def explain(self, *args, **kwargs) -> list[QueryPlanStep]:
+        return await self.run(lambda w: w.explain(*args, **kwargs))
+
+    async def insert_into(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.insert_into(*args, **kwargs))
+
+    async def insert_many(self, *args, **kwargs) -> str:
+        # values 如果是生成器，会在连接线程中被消费
+        return await self.run(lambda w: w.insert_many(*args, **kwargs))
+
+    async def upsert(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.upsert(*args, **kwargs))
+
+    async def bulk_update(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.bulk_update(*args, **kwargs))
+
+    async def update(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.update(*args, **kwargs))
+
+    async def delete_from(self, *args, **kwargs) -> str:
+        return await self.run(lambda w: w.delete_from(*args, **kwargs))
+
+    async def import_csv(self, *args, **kwargs) -> TransferReport:
+        # 文件的读写和 progress 回调都在连接线程中进行
+        return await self.run(lambda w: w.import_csv(*args, **kwargs))
+
+    async def import_jsonl(self, *args, **kwargs) -> TransferReport:
+        return await self.run(lambda w: w.import_jsonl(*args, **kwargs))
+
+    async def export_csv(self, *args, **kwargs) -> TransferReport:
+        return await self.run(lambda w: w.export_csv(*args, **kwargs))
+
+    async def export_jsonl(self, *args, **kwargs) -> TransferReport:
+        return await self.run(lambda w: w.export_jsonl(*args, **kwargs))
+
+    async def insert_blob(self, *args, **kwargs) -> int:
+        return await self.run(lambda w: w.insert_blob(*args, **kwargs))
+
+    async def read_blob(self, *args, **kwargs) -> int:
+        return await self.run(lambda w: w.read_blob(*args, **kwargs))
+
+    async def show_tables(self) -> list[str]:
+        return await self.run(lambda w: w.show_tables())
+
+    async def table_columns(self, table_name: str) -> list[ColumnInfo]:
+        return await self.run(lambda w: w.table_columns(table_name))
+
+    async def table_indexes(self, table_name: str) -> list[IndexInfo]:
+        return await self.run(lambda w: w.table_indexes(table_name))
+
+    async def reflect_table(self, *args, **kwargs) -> Table:
+        return await self.run(lambda w: w.reflect_table(*args, **kwargs))
+
+    async def select(self, *args, **kwargs) -> tuple[str, list[list]]:
+        if self._pool is None:
+            return await self.run(lambda w: w.select(*args, **kwargs))
+        # 只读连接看不到连接线程中尚未提交的修改
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_executor, lambda: self._pool.select(*args, **kwargs))
+
+    async def count(self, *args, **kwargs) -> int:
+        return await self.run(lambda w: w.count(*args, **kwargs))
+
+    async def exists(self, *args, **kwargs) -> bool:
+        return await self.run(lambda w: w.exists(*args, **kwargs))
+
+    async def iter_select(self, *args, chunk_size: int = 1000, **kwargs) -> AsyncIterator[list]:
+        """异步迭代查询结果，每次在连接线程中取 chunk_size 行"""
+        rows_iter = await self.run(lambda w: w.iter_select(*args, chunk_size=chunk_size, **kwargs))
+        try:
+            while True:
+                rows = await self.run(lambda _: list(islice(rows_iter, chunk_size)))
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            # 生成器要在创建它的线程中关闭，以便释放游标
+            if not self._is_closed:
+                await self.run(lambda _: rows_iter.close())
@@ -0,0 +1,42 @@
+# coding: utf8
+from __future__ import annotations
+
+import os
+import sqlite3
+from os import PathLike
+from typing import IO
+
+BinaryPathOrFile = str | PathLike[str] | IO[bytes]
+
+
+def check_blobopen():
+    if not hasattr(sqlite3.Connection, "blobopen"):
+        raise ValueError("Streaming BLOB requires python 3.11 or later")
+
+
+def remaining_size(f: IO[bytes]) -> int | None:
+    """文件从当前位置到结尾的字节数，无法得知时（比如管道和套接字）为 None"""
+    try:
+        return os.fstat(f.fileno()).st_size - f.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        pos = f.tell()
+        end = f.seek(0, os.SEEK_END)
+        f.seek(pos)
+        return end - pos
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def copy_stream(src: IO[bytes], dst: IO[bytes], size: int | None, chunk_size: int) -> int:
+    """每次复制 chunk_size 字节，size 不为 None 时最多复制 size 字节，返回实际复制的字节数"""
+    copied = 0
+    while size is None or copied < size:
+        n = chunk_size if size is None else min(chunk_size, size - copied)
+        chunk = src.read(n)
+        if not chunk:
+            break
+        dst.write(chunk)
+        copied += len(chunk)
+    return copied
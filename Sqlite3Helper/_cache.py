@@ -0,0 +1,189 @@
+# coding: utf8
+from __future__ import annotations
+
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from typing import Any, NamedTuple
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class StatementCache(object):
+    """按查询结构缓存生成好的带占位符的语句，LRU 淘汰，maxsize 为 0 时不缓存"""
+
+    def __init__(self, maxsize: int = 128):
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self._maxsize = maxsize
+        self._data: OrderedDict[Hashable, str] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable, build: Callable[[], str]) -> str:
+        try:
+            statement = self._data[key]
+        except KeyError:
+            pass
+        else:
+            self._hits += 1
+            self._data.move_to_end(key)
+            return statement
+
+        self._misses += 1
+        statement = build()
+        if self._maxsize > 0:
+            self._data[key] = statement
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+        return statement
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self._hits, self._misses, self._maxsize, len(self._data))
+
+    def clear(self):
+        self._data.clear()
+        self._hits = 0
+        self._misses = 0
+
+
+class ResultCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    entries: int
+    rows: int
+    bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+def _estimate_size(rows: list) -> int:
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            size += sys.getsizeof(value)
+    return size
+
+
+class CachedRows(tuple):
+    """
+    结果缓存中保存的行，每行都是元组，不会被调用者修改。
+    make 把一行转换为调用者要求的形式，每次取出时都生成新的行
+    """
+
+    def __new__(cls, rows: Iterable[tuple], make: Callable[[tuple], Any]):
+        self = super().__new__(cls, rows)
+        self.make = make
+        return self
+
+    def copy(self) -> list:
+        return [self.make(row) for row in self]
+
+
+class _Entry(NamedTuple):
+    tables: frozenset[str]
+    rows: list
+    size: int
+    expires: float | None
+
+
+class ResultCache(object):
+    """
+    查询结果缓存，按 (语句, 参数, 结果形式) 缓存，LRU 淘汰，
+    max_rows 和 max_bytes 限制缓存的总行数和估算的总字节数，ttl 为每条结果的有效秒数。
+    写操作通过 invalidate 按表清除结果，可以在多个连接之间共用。
+    """
+
+    def __init__(self, max_rows: int = None, max_bytes: int = None, ttl: float = None):
+        if max_rows is None and max_bytes is None:
+            raise ValueError("At least one of max_rows and max_bytes must be given")
+        if max_rows is not None and max_rows <= 0:
+            raise ValueError("max_rows must be positive")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._data: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._rows = 0
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        # 每次清除都加一，查询开始之后有清除的话，查到的结果不再放入缓存
+        self._generation = 0
+        # 用到结果缓存时才导入 threading
+        import threading
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> list | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._data.move_to_end(key)
+            return entry.rows
+
+    def put(self, key: Hashable, tables: Iterable[str], rows: list, generation: int):
+        size = _estimate_size(rows) if self._max_bytes is not None else 0
+        if ((self._max_rows is not None and len(rows) > self._max_rows)
+                or (self._max_bytes is not None and size > self._max_bytes)):
+            return
+        expires = None if self._ttl is None else time.monotonic() + self._ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = _Entry(frozenset(t.lower() for t in tables), rows, size, expires)
+            self._rows += len(rows)
+            self._bytes += size
+            while ((self._max_rows is not None and self._rows > self._max_rows)
+                   or (self._max_bytes is not None and self._bytes > self._max_bytes)):
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key)
+        self._rows -= len(entry.rows)
+        self._bytes -= entry.size
+
+    def invalidate(self, *tables: str):
+        names = {t.lower() for t in tables}
+        with self._lock:
+            self._generation += 1
+            for key in [k for k, e in self._data.items() if not e.tables.isdisjoint(names)]:
+                self._remove(key)
+
+    def info(self) -> ResultCacheInfo:
+        with self._lock:
+            return ResultCacheInfo(self._hits, self._misses, len(self._data), self._rows, self._bytes)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._rows = 0
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
@@ -1,6 +1,8 @@
 # coding: utf8
+from __future__ import annotations
 from abc import ABC
-from dataclasses import dataclass, field
+from weakref import WeakKeyDictionary
+from dataclasses import dataclass, field, replace
 from ._types_def import DataType, GeneralValueTypes
 from ._util_func import to_string
 
@@ -36,6 +38,11 @@ class Column(object):
     __repr__ = __str__
 
 
+# 每个 Table 子类中是列的属性名，按 __dir__ 的顺序，第一次实例化时计算。
+# reflect_table 会动态生成类，用弱引用，类不再使用时记录随之删除
+_table_columns: WeakKeyDictionary[type, tuple[str, ...]] = WeakKeyDictionary()
+
+
 @dataclass
 class Table(ABC):
     table: str = ""
@@ -45,7 +52,15 @@ class Table(ABC):
     def __post_init__(self):
         if len(self.table) == 0:
             raise ValueError("table name must be set")
-        for i in self.__dir__():
-            a = getattr(self, i)
-            if isinstance(a, Column):
-                self.all.append(a)
+        cls = type(self)
+        names = _table_columns.get(cls)
+        if names is None:
+            names = tuple(i for i in self.__dir__() if isinstance(getattr(self, i), Column))
+            _table_columns[cls] = names
+        self.all.extend(getattr(self, i) for i in names)
+
+    def qualified(self, column: Column | str) -> Column | str:
+        """带表名的列，比如 persons.name ，用于 JOIN ，其他属性（包括 secure）不变"""
+        if isinstance(column, Column):
+            return replace(column, name=f"{self.table}.{column.name}")
+        return f"{self.table}.{column}"
@@ -0,0 +1,93 @@
+# coding: utf8
+from __future__ import annotations
+
+from array import array
+from collections.abc import Sequence
+from typing import Any, NamedTuple
+
+from ._column import Column
+from ._types_def import DataType
+
+# INTEGER 和 REAL 以外的列没有对应的定长类型，仍然用列表保存
+TYPECODES = {
+    DataType.INTEGER: "q",
+    DataType.REAL: "d",
+}
+
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class ColumnArray(NamedTuple):
+    # array.array 、numpy 数组或者列表
+    values: Any
+    # 可以为 NULL 的列才有，True 表示该位置为 NULL ，对应的 values 中填 0
+    mask: Any = None
+
+
+class ColumnBuffer(object):
+    """
+    按块接收一列数据，数值列追加到 array.array 中（随数据增长，不预先分配），
+    最后可以不复制地转换为 numpy 数组。
+    SQLite 的列类型只是亲和性，数值列中出现其他类型的值时（比如 INTEGER 列中的 REAL），该列改用列表保存
+    """
+
+    def __init__(self, column: Column | str):
+        data_type = column.data_type if isinstance(column, Column) else None
+        self.typecode = TYPECODES.get(data_type)
+        self.nullable = not isinstance(column, Column) or column.nullable
+        self.values = array(self.typecode) if self.typecode is not None else []
+        self.mask = array("b") if self.nullable else None
+
+    def extend(self, values: Sequence):
+        if self.mask is not None:
+            self.mask.extend([value is None for value in values])
+            if self.typecode is not None:
+                values = [0 if value is None else value for value in values]
+        if self.typecode is not None:
+            size = len(self.values)
+            try:
+                self.values.extend(values)
+                return
+            except (TypeError, OverflowError):
+                # 出错时已经追加了一部分，去掉后整列转为列表
+                del self.values[size:]
+                self.values = self.values.tolist()
+                self.typecode = None
+        self.values.extend(values)
+
+    def finish(self, numpy=None) -> ColumnArray:
+        values = self.values
+        mask = self.mask
+        if numpy is not None:
+            if self.typecode is not None:
+                values = numpy.frombuffer(values, dtype=numpy.int64 if self.typecode == "q" else numpy.float64)
+            else:
+                values = numpy.array(values, dtype=object)
+            if mask is not None:
+                mask = numpy.frombuffer(mask, dtype=numpy.int8).astype(bool)
+        return ColumnArray(values, mask)
+
+
+def iter_column_rows(arrays: Sequence[Sequence], masks: Sequence[Sequence | None], chunk_size: int):
+    """把按列存放的数据按块转换为行，numpy 和 array.array 的元素转为 Python 对象"""
+    length = len(arrays[0])
+    for values in arrays:
+        if len(values) != length:
+            raise ValueError("All arrays must have the same length")
+
+    for start in range(0, length, chunk_size):
+        columns = []
+        for values, mask in zip(arrays, masks):
+            part = values[start:start + chunk_size]
+            part = part.tolist() if hasattr(part, "tolist") else list(part)
+            if mask is not None:
+                null_part = mask[start:start + chunk_size]
+                part = [None if is_null else value for value, is_null in zip(part, null_part)]
+            columns.append(part)
+        yield from zip(*columns)
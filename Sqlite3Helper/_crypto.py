@@ -1,36 +1,93 @@
 # coding: utf8
+from __future__ import annotations
+
 import os
 import time
+from functools import lru_cache
+from types import ModuleType
+from typing import TYPE_CHECKING
 
-try:
+if TYPE_CHECKING:
     from cryptography.fernet import Fernet
-except ImportError:
-    class Fernet(object):
-        def __init__(self, key, backend):
-            pass
 
 
-def generate_key_and_stuff():
+class _FallbackFernet(object):
+    def __init__(self, key, backend):
+        pass
+
+
+class _FallbackInvalidToken(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _load_fernet_module() -> ModuleType | None:
+    # 导入 cryptography 比较慢，只在真正用到加密的时候才导入
     try:
-        key = Fernet.generate_key()
-    except AttributeError:
+        from cryptography import fernet
+    except ImportError:
+        return None
+    return fernet
+
+
+def invalid_token() -> type[Exception]:
+    """解密失败时抛出的异常类型，没有安装 cryptography 时是一个不会被抛出的异常"""
+    module = _load_fernet_module()
+    return _FallbackInvalidToken if module is None else module.InvalidToken
+
+
+def generate_key_and_stuff():
+    module = _load_fernet_module()
+    if module is None:
         raise ModuleNotFoundError("cryptography is not installed, see readme.")
 
+    key = module.Fernet.generate_key()
     fix_time = int(time.time())
     fix_iv = os.urandom(16)
     return key, fix_time, fix_iv
 
 
-class NotRandomFernet(Fernet):
-    """固定下来每次相同的 key 的加密结果相同，方便条件查询"""
+@lru_cache(maxsize=None)
+def _not_random_fernet_class() -> type[Fernet]:
+    module = _load_fernet_module()
+    base = _FallbackFernet if module is None else module.Fernet
+
+    class NotRandomFernet(base):
+        """固定下来每次相同的 key 的加密结果相同，方便条件查询"""
+
+        def __init__(self, key: bytes | str, fix_time: int, fix_iv: bytes, backend=None):
+            super().__init__(key, backend)
+            self._fix_time = fix_time
+            self._fix_iv = fix_iv
+
+        def encrypt(self, data: bytes) -> bytes:
+            try:
+                return self._encrypt_from_parts(data, self._fix_time, self._fix_iv)
+            except AttributeError:
+                return data
+
+    # 进程池传递对象时按 模块.NotRandomFernet 找到这个类，见 __getattr__
+    NotRandomFernet.__qualname__ = "NotRandomFernet"
+    return NotRandomFernet
+
+
+def __getattr__(name: str):
+    # NotRandomFernet 继承自 Fernet ，第一次访问时才导入 cryptography 并创建
+    if name == "NotRandomFernet":
+        return _not_random_fernet_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def new_fernet(key: bytes | str, fix_time: int, fix_iv: bytes) -> NotRandomFernet:
+    return _not_random_fernet_class()(key, fix_time, fix_iv)
+
+
+@lru_cache(maxsize=32)
+def get_fernet(key: bytes | str, fix_time: int, fix_iv: bytes) -> NotRandomFernet:
+    """相同的密钥信息共用一个对象，避免每次比较都重新构造"""
+    return new_fernet(key, fix_time, fix_iv)
 
-    def __init__(self, key: bytes | str, fix_time: int, fix_iv: bytes, backend=None):
-        super().__init__(key, backend)
-        self._fix_time = fix_time
-        self._fix_iv = fix_iv
 
-    def encrypt(self, data: bytes) -> bytes:
-        try:
-            return self._encrypt_from_parts(data, self._fix_time, self._fix_iv)
-        except AttributeError:
-            return data
+if TYPE_CHECKING:
+    class NotRandomFernet(Fernet):
+        def __init__(self, key: bytes | str, fix_time: int, fix_iv: bytes, backend=None): ...
@@ -0,0 +1,34 @@
+# coding: utf8
+from __future__ import annotations
+
+import re
+from typing import NamedTuple
+
+
+class QueryPlanStep(NamedTuple):
+    id: int
+    parent: int
+    detail: str
+
+    @property
+    def is_scan(self) -> bool:
+        # 3.36 之前是 SCAN TABLE xxx，之后是 SCAN xxx
+        return self.detail.startswith("SCAN ")
+
+    def scans(self, table_name: str) -> bool:
+        """是否逐行扫描了这个表"""
+        if not self.is_scan:
+            return False
+        words = self.detail.split()
+        target = words[2] if len(words) > 2 and words[1] == "TABLE" else words[1]
+        return target == table_name
+
+
+class IndexAdvice(NamedTuple):
+    table: str
+    columns: tuple[str, ...]
+    statement: str
+
+
+def suggest_index_name(table_name: str, columns: tuple[str, ...]) -> str:
+    return re.sub(r"\W+", "_", f"idx_{table_name}_{'_'.join(columns)}")
@@ -0,0 +1,109 @@
+# coding: utf8
+from __future__ import annotations
+
+import re
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+
+
+def _logger():
+    # 导入 logging 比较慢，第一次记录慢查询时才导入
+    import logging
+    return logging.getLogger("Sqlite3Helper")
+
+
+BeforeHook = Callable[[str, Sequence | None], None]
+AfterHook = Callable[[str, Sequence | None, float, int], None]
+
+# 字符串、BLOB 和数字字面量，数字前面不能是标识符中的字符
+_LITERAL_RE = re.compile(r"X'[0-9a-fA-F]*'|'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+# 连续的 (?, ?), (?, ?) 或 IN (?, ?, ?) 合并为一个
+_VALUES_RE = re.compile(r"\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+
+
+def normalize_statement(statement: str) -> str:
+    """把语句中的字面量替换为 ?，只保留语句的结构，用于分组统计"""
+    statement = _LITERAL_RE.sub("?", statement)
+    return _VALUES_RE.sub("(...)", statement)
+
+
+@dataclass
+class StatementStats(object):
+    statement: str
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    rows: int = 0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class Instrumentation(object):
+    """
+    记录每条语句的执行时间和行数，按语句结构汇总，
+    同时累计加密、解密、生成语句所花的时间。
+    """
+
+    def __init__(self, slow_query_threshold: float = None):
+        self.slow_query_threshold = slow_query_threshold
+        self._before_hooks: list[BeforeHook] = []
+        self._after_hooks: list[AfterHook] = []
+        self._stats: dict[str, StatementStats] = {}
+        self._timings: dict[str, float] = {}
+
+    def add_hook(self, before: BeforeHook = None, after: AfterHook = None):
+        if before is not None:
+            self._before_hooks.append(before)
+        if after is not None:
+            self._after_hooks.append(after)
+
+    def remove_hook(self, hook: BeforeHook | AfterHook):
+        if hook in self._before_hooks:
+            self._before_hooks.remove(hook)
+        if hook in self._after_hooks:
+            self._after_hooks.remove(hook)
+
+    def _get_stats(self, statement: str) -> StatementStats:
+        shape = normalize_statement(statement)
+        stats = self._stats.get(shape)
+        if stats is None:
+            stats = self._stats[shape] = StatementStats(shape)
+        return stats
+
+    def before(self, statement: str, parameters: Sequence | None):
+        for hook in self._before_hooks:
+            hook(statement, parameters)
+
+    def after(self, statement: str, parameters: Sequence | None, elapsed: float, rowcount: int):
+        stats = self._get_stats(statement)
+        stats.calls += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        if rowcount > 0:
+            stats.rows += rowcount
+
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            _logger().warning("Slow query (%.3fs): %s", elapsed, statement)
+        for hook in self._after_hooks:
+            hook(statement, parameters, elapsed, rowcount)
+
+    def add_rows(self, statement: str, rows: int, elapsed: float):
+        """查询语句的行数和取数据的时间要在 fetch 之后才知道，单独补上"""
+        stats = self._get_stats(statement)
+        stats.rows += rows
+        stats.total_time += elapsed
+
+    def add_time(self, category: str, elapsed: float):
+        self._timings[category] = self._timings.get(category, 0.0) + elapsed
+
+    def stats(self) -> list[StatementStats]:
+        return sorted(self._stats.values(), key=lambda s: s.total_time, reverse=True)
+
+    def timings(self) -> dict[str, float]:
+        return dict(self._timings)
+
+    def reset(self):
+        self._stats.clear()
+        self._timings.clear()
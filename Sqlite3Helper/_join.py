@@ -0,0 +1,67 @@
+# coding: utf8
+from __future__ import annotations
+
+from ._column import Table
+from ._where import Expression
+
+
+def _table_name(table: Table | type[Table] | str) -> str:
+    if isinstance(table, str):
+        return table
+    if isinstance(table, Table):
+        return table.table
+    # 没有实例化的 Table 子类，用类中 table 的默认值
+    if isinstance(table, type) and issubclass(table, Table) and len(table.table) != 0:
+        return table.table
+    raise ValueError(f"Table must be str or Table object, found {type(table)}")
+
+
+class Join(object):
+    """
+    可以代替表名传给 select 、iter_select 、count 等方法的连接，
+    ON 条件由 Operand 构造，其中的值同样以 ? 绑定。每次 inner 、left 都返回新的对象。
+
+        Join(persons).left(orders, Operand(persons.qualified(persons.person_id))
+                                   .equal_to_column(orders.qualified(orders.person_id)))
+    """
+
+    def __init__(self, table: Table | type[Table] | str):
+        name = _table_name(table)
+        self._parts = [name]
+        self._literal = name
+        self._params = []
+        self._tables = (name,)
+
+    def _join(self, kind: str, table: Table | type[Table] | str, on: Expression) -> Join:
+        if not isinstance(on, Expression):
+            raise ValueError(f"on must be Expression, found {type(on)}")
+        name = _table_name(table)
+        join = Join.__new__(Join)
+        join._parts = [*self._parts, f"{kind} {name} ON {on.sql}"]
+        join._literal = f"{self._literal} {kind} {name} ON {on}"
+        join._params = self._params + on.params
+        join._tables = self._tables + (name,)
+        return join
+
+    def inner(self, table: Table | type[Table] | str, on: Expression) -> Join:
+        return self._join("INNER JOIN", table, on)
+
+    def left(self, table: Table | type[Table] | str, on: Expression) -> Join:
+        return self._join("LEFT JOIN", table, on)
+
+    @property
+    def sql(self) -> str:
+        """带 ? 占位符的 FROM 子句"""
+        return " ".join(self._parts)
+
+    @property
+    def params(self) -> list:
+        return list(self._params)
+
+    @property
+    def tables(self) -> tuple[str, ...]:
+        """涉及的所有表，用于查询结果缓存的失效"""
+        return self._tables
+
+    def __str__(self):
+        return self._literal
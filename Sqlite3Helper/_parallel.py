@@ -0,0 +1,90 @@
+# coding: utf8
+from __future__ import annotations
+
+import os
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice, repeat
+from typing import TYPE_CHECKING
+
+from ._crypto import invalid_token
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from ._crypto import NotRandomFernet
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+# 以下两个函数要在子进程中执行，所以必须定义在模块顶层
+
+def _encrypt_chunk(fernet: NotRandomFernet, values: list[bytes]) -> list[bytes]:
+    return [fernet.encrypt(value) for value in values]
+
+
+def _decrypt_chunk(fernet: NotRandomFernet, tokens: list[bytes]) -> list[bytes]:
+    results = []
+    error = invalid_token()
+    for token in tokens:
+        # 与逐行解密相同，解密失败的数据原样保留
+        try:
+            results.append(fernet.decrypt(token))
+        except (error, AttributeError):
+            results.append(token)
+    return results
+
+
+class CryptoExecutor(object):
+    """把一批数据的加解密分给线程池或进程池执行，结果顺序与输入一致"""
+
+    def __init__(self, executor: str | Executor = "thread", max_workers: int = None, batch_size: int = 1024):
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+
+        # concurrent.futures 会导入 threading 和 logging ，用到时才导入
+        if executor == "thread":
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers)
+            self._owned = True
+        elif executor == "process":
+            # 进程池还会导入 multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers)
+            self._owned = True
+        else:
+            from concurrent.futures import Executor
+            if not isinstance(executor, Executor):
+                raise ValueError(f"Unknown executor: {executor}")
+            # 外部传入的由外部负责关闭
+            self._executor = executor
+            self._owned = False
+
+        self._workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    def _map(self, func: Callable, fernet: NotRandomFernet, values: list[bytes]) -> list[bytes]:
+        if len(values) == 0:
+            return []
+        # 每个 worker 分到一块，每块只需要传递一次 fernet
+        size = -(-len(values) // self._workers)
+        chunks = [values[i:i + size] for i in range(0, len(values), size)]
+        results = []
+        for part in self._executor.map(func, repeat(fernet), chunks):
+            results.extend(part)
+        return results
+
+    def encrypt_many(self, fernet: NotRandomFernet, values: list[bytes]) -> list[bytes]:
+        return self._map(_encrypt_chunk, fernet, values)
+
+    def decrypt_many(self, fernet: NotRandomFernet, tokens: list[bytes]) -> list[bytes]:
+        return self._map(_decrypt_chunk, fernet, tokens)
+
+    def shutdown(self):
+        if self._owned:
+            self._executor.shutdown()
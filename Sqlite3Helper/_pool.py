@@ -0,0 +1,253 @@
+# coding: utf8
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from collections.abc import Iterator
+from os import PathLike
+from typing import TYPE_CHECKING
+
+from ._column import Column, Table
+from ._where import Operand
+from ._index import QueryPlanStep
+from ._schema import ColumnInfo, IndexInfo
+from ._pragma import PROFILES
+from ._worker import Sqlite3Worker
+
+if TYPE_CHECKING:
+    from ._transfer import TransferReport
+
+
+class Sqlite3WorkerPool(object):
+    """
+    同一个数据库文件的连接池，一个写连接加若干个只读连接，数据库使用 WAL 模式，
+    读操作可以在多个线程中并行，写操作通过锁串行执行。
+    每个连接同一时间只会被一个线程借出，因此游标也是每个线程独享的。
+    worker_options 会传给每个 Sqlite3Worker，比如 profile 、cache_size 等。
+    """
+
+    def __init__(
+            self,
+            db_name: str | PathLike[str],
+            key: bytes = None,
+            fix_time: int = None,
+            fix_iv: bytes = None,
+            readers: int = 4,
+            timeout: float = 5.0,
+            **worker_options,
+    ):
+        self._is_closed = True
+        if str(db_name) == ":memory:":
+            raise ValueError("Memory database can not be shared between connections")
+        if readers <= 0:
+            raise ValueError("readers must be positive")
+
+        # 所有连接必须使用相同的 fix_time 和 fix_iv，否则加密结果不同，无法条件查询
+        if key is not None:
+            fix_time = fix_time if fix_time is not None else int(time.time())
+            fix_iv = fix_iv if fix_iv is not None else os.urandom(16)
+
+        self._db_name = db_name
+        self._timeout = timeout
+
+        # 先建立写连接，保证数据库文件存在并切换到 WAL 模式
+        worker_options["check_same_thread"] = False
+        profile = worker_options.pop("profile", None)
+        self._writer = Sqlite3Worker(db_name, key, fix_time, fix_iv,
+                                     **{**worker_options, "profile": profile, "journal_mode": "WAL"})
+        # WAL 模式是持久的，只读连接不需要也不能再切换。
+        # profile 中也可能带有 journal_mode ，只读连接上把 profile 展开成单独的值，去掉 journal_mode
+        if profile is not None:
+            for name, value in PROFILES[profile].items():
+                if worker_options.get(name) is None:
+                    worker_options[name] = value
+        worker_options.pop("journal_mode", None)
+        self._writer_lock = threading.RLock()
+
+        self._all_readers = []
+        self._readers = queue.LifoQueue()
+        for _ in range(readers):
+            worker = Sqlite3Worker(db_name, key, fix_time, fix_iv, **worker_options)
+            worker._execute("PRAGMA query_only = ON;")
+            self._all_readers.append(worker)
+            self._readers.put(worker)
+        self._is_closed = False
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def db_name(self) -> str:
+        return self._db_name
+
+    def close(self):
+        if self._is_closed is False:
+            for worker in self._all_readers:
+                worker.close()
+            self._writer.close()
+            self._is_closed = True
+
+    def _get_timeout(self, timeout: float | None) -> float:
+        return self._timeout if timeout is None else timeout
+
+    @contextmanager
+    def reader(self, timeout: float = None) -> Iterator[Sqlite3Worker]:
+        """借出一个只读连接，用完自动归还"""
+        timeout = self._get_timeout(timeout)
+        try:
+            worker = self._readers.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No reader connection available in {timeout}s")
+        try:
+            yield worker
+        finally:
+            self._readers.put(worker)
+
+    @contextmanager
+    def writer(self, timeout: float = None) -> Iterator[Sqlite3Worker]:
+        """独占写连接，同一线程内可以重入"""
+        timeout = self._get_timeout(timeout)
+        if not self._writer_lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Writer connection is not available in {timeout}s")
+        try:
+            yield self._writer
+        finally:
+            self._writer_lock.release()
+
+    @contextmanager
+    def transaction(self, mode: str = "DEFERRED") -> Iterator[Sqlite3Worker]:
+        # 持有写锁直到事务结束，本线程内的其他写操作可以重入
+        with self.writer() as worker, worker.transaction(mode):
+            yield worker
+
+    @contextmanager
+    def batch(self, size: int, mode: str = "DEFERRED") -> Iterator[Sqlite3Worker]:
+        with self.writer() as worker, worker.batch(size, mode):
+            yield worker
+
+    def commit(self):
+        with self.writer() as worker:
+            worker.commit()
+
+    def operand(self, column: Column | str) -> Operand:
+        return self._writer.operand(column)
+
+    def show_tables(self) -> list[str]:
+        with self.reader() as worker:
+            return worker.show_tables()
+
+    def table_columns(self, table_name: str) -> list[ColumnInfo]:
+        with self.reader() as worker:
+            return worker.table_columns(table_name)
+
+    def table_indexes(self, table_name: str) -> list[IndexInfo]:
+        with self.reader() as worker:
+            return worker.table_indexes(table_name)
+
+    def reflect_table(self, *args, **kwargs) -> Table:
+        with self.reader() as worker:
+            return worker.reflect_table(*args, **kwargs)
+
+    def select(self, *args, **kwargs) -> tuple[str, list[list]]:
+        with self.reader() as worker:
+            return worker.select(*args, **kwargs)
+
+    def iter_select(self, *args, **kwargs) -> Iterator[list]:
+        # 迭代结束之前一直占用该只读连接
+        with self.reader() as worker:
+            yield from worker.iter_select(*args, **kwargs)
+
+    def count(self, *args, **kwargs) -> int:
+        with self.reader() as worker:
+            return worker.count(*args, **kwargs)
+
+    def exists(self, *args, **kwargs) -> bool:
+        with self.reader() as worker:
+            return worker.exists(*args, **kwargs)
+
+    def paginate(self, *args, **kwargs) -> Iterator[list[list]]:
+        with self.reader() as worker:
+            yield from worker.paginate(*args, **kwargs)
+
+    def create_table(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.create_table(*args, **kwargs)
+
+    def drop_table(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.drop_table(*args, **kwargs)
+
+    def rename_table(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.rename_table(*args, **kwargs)
+
+    def add_column(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.add_column(*args, **kwargs)
+
+    def rename_column(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.rename_column(*args, **kwargs)
+
+    def create_index(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.create_index(*args, **kwargs)
+
+    def drop_index(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.drop_index(*args, **kwargs)
+
+    def explain(self, *args, **kwargs) -> list[QueryPlanStep]:
+        with self.reader() as worker:
+            return worker.explain(*args, **kwargs)
+
+    def insert_into(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.insert_into(*args, **kwargs)
+
+    def insert_many(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.insert_many(*args, **kwargs)
+
+    def upsert(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.upsert(*args, **kwargs)
+
+    def bulk_update(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.bulk_update(*args, **kwargs)
+
+    def update(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.update(*args, **kwargs)
+
+    def delete_from(self, *args, **kwargs) -> str:
+        with self.writer() as worker:
+            return worker.delete_from(*args, **kwargs)
+
+    def import_csv(self, *args, **kwargs) -> TransferReport:
+        with self.writer() as worker:
+            return worker.import_csv(*args, **kwargs)
+
+    def import_jsonl(self, *args, **kwargs) -> TransferReport:
+        with self.writer() as worker:
+            return worker.import_jsonl(*args, **kwargs)
+
+    def export_csv(self, *args, **kwargs) -> TransferReport:
+        with self.reader() as worker:
+            return worker.export_csv(*args, **kwargs)
+
+    def export_jsonl(self, *args, **kwargs) -> TransferReport:
+        with self.reader() as worker:
+            return worker.export_jsonl(*args, **kwargs)
+
+    def insert_blob(self, *args, **kwargs) -> int:
+        with self.writer() as worker:
+            return worker.insert_blob(*args, **kwargs)
+
+    def read_blob(self, *args, **kwargs) -> int:
+        with self.reader() as worker:
+            return worker.read_blob(*args, **kwargs)
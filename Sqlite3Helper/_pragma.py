@@ -0,0 +1,69 @@
+# coding: utf8
+from __future__ import annotations
+
+# 按这个顺序设置，page_size 必须在切换到 WAL 和建表之前设置才有效
+PRAGMA_NAMES = ("page_size", "journal_mode", "synchronous", "cache_size",
+                "mmap_size", "temp_store", "busy_timeout")
+
+PROFILES = {
+    # 默认的回滚日志，每次提交都完整落盘
+    "durable": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    # 读多写少，WAL 模式下读写互不阻塞，较大的缓存和内存映射
+    "read_heavy": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64 * 1024,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # 大批量导入，不等待落盘，断电可能丢失或损坏数据，导入完成后应换回其他配置
+    "bulk_load": {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "cache_size": -256 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+_CHOICES = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+
+
+def _check_value(name: str, value: str | int) -> str:
+    # PRAGMA 不支持参数绑定，只允许整数和固定的选项，避免拼接出其他语句
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Invalid value for {name}: {value!r}")
+    if isinstance(value, int):
+        if name == "journal_mode":
+            raise ValueError(f"Invalid value for {name}: {value!r}")
+        return str(value)
+
+    value = value.upper()
+    if value not in _CHOICES.get(name, ()):
+        raise ValueError(f"Invalid value for {name}: {value!r}")
+    return value
+
+
+def pragma_statements(profile: str = None, **pragmas: str | int | None) -> list[str]:
+    """合并配置和单独指定的值，生成要执行的 PRAGMA 语句，单独指定的值优先"""
+    values = {}
+    if profile is not None:
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}, must be one of {', '.join(PROFILES)}")
+        values.update(PROFILES[profile])
+    for name, value in pragmas.items():
+        if name not in PRAGMA_NAMES:
+            raise ValueError(f"Unsupported pragma: {name}")
+        if value is not None:
+            values[name] = value
+
+    return [f"PRAGMA {name} = {_check_value(name, values[name])};"
+            for name in PRAGMA_NAMES if name in values]
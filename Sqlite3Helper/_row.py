@@ -0,0 +1,57 @@
+# coding: utf8
+from __future__ import annotations
+
+import re
+from collections import namedtuple
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+from typing import Any
+
+from ._column import Table
+
+RowType = str | Table | type[Table]
+
+ROW_TYPES = ("list", "tuple", "dict", "record")
+
+# JOIN 中带表名的列，比如 persons.name
+_QUALIFIED_PATTERN = re.compile(r"^\w+\.(\w+)$")
+
+
+@lru_cache(maxsize=256)
+def record_class(name: str, fields: tuple[str, ...]) -> type:
+    """
+    生成只有这些字段的记录类，每个名称和字段组合只生成一次。
+    基于 namedtuple ，__slots__ 为空，可以用属性访问，不是合法标识符的列名会被改为 _0 、_1 这样的名字。
+    """
+    return namedtuple(name, fields, rename=True)
+
+
+def _record_fields(names: Sequence[str]) -> tuple[str, ...]:
+    """记录类的字段名，带表名的列去掉表名，去掉之后重名时报错"""
+    fields = tuple(m.group(1) if (m := _QUALIFIED_PATTERN.match(name)) else name for name in names)
+    if fields != tuple(names) and len(set(fields)) != len(fields):
+        raise ValueError(f"Columns {', '.join(names)} have the same name without table prefix, "
+                         f"use AS to give them different names")
+    return fields
+
+
+def row_factory(row_type: RowType, names: Sequence[str]) -> Callable[[Sequence], Any]:
+    """
+    把数据库返回的每一行转换为指定的形式：
+    list 复制为列表，tuple 直接返回（不复制），dict 以列名为键，record 为生成的记录类，
+    也可以传入 Table 的子类或实例，生成以它命名的记录类。
+    """
+    if isinstance(row_type, Table):
+        return record_class(f"{type(row_type).__name__}Row", _record_fields(names))._make
+    if isinstance(row_type, type) and issubclass(row_type, Table):
+        return record_class(f"{row_type.__name__}Row", _record_fields(names))._make
+    if row_type == "list":
+        return list
+    if row_type == "tuple":
+        return tuple
+    if row_type == "dict":
+        names = tuple(names)
+        return lambda row: dict(zip(names, row))
+    if row_type == "record":
+        return record_class("Row", _record_fields(names))._make
+    raise ValueError(f"row_type must be one of {', '.join(ROW_TYPES)} or a Table, found {row_type!r}")
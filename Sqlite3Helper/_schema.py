@@ -0,0 +1,128 @@
+# coding: utf8
+from __future__ import annotations
+
+import re
+from dataclasses import field, make_dataclass
+from typing import NamedTuple
+
+from ._column import Column, Table
+from ._types_def import DataType, GeneralValueTypes
+
+
+class ColumnInfo(NamedTuple):
+    cid: int
+    name: str
+    type: str
+    notnull: bool
+    default: str | None
+    pk: int
+
+
+class IndexInfo(NamedTuple):
+    name: str
+    unique: bool
+    origin: str
+    partial: bool
+    columns: tuple[str, ...]
+
+
+class SchemaCatalog(object):
+    """
+    表、列和索引信息的缓存，按 PRAGMA schema_version 判断是否过期，
+    执行 DDL 的方法也会直接清空
+    """
+
+    def __init__(self):
+        self.version: int | None = None
+        self.tables: list[str] | None = None
+        self.columns: dict[str, tuple[ColumnInfo, ...]] = {}
+        self.indexes: dict[str, tuple[IndexInfo, ...]] = {}
+
+    def check(self, version: int):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self):
+        self.version = None
+        self.tables = None
+        self.columns.clear()
+        self.indexes.clear()
+
+
+def affinity(declared_type: str) -> DataType:
+    """按 SQLite 的类型亲和性规则把声明的类型对应到 DataType ，NUMERIC 亲和性视为 REAL"""
+    t = declared_type.upper()
+    if "INT" in t:
+        return DataType.INTEGER
+    if "CHAR" in t or "CLOB" in t or "TEXT" in t:
+        return DataType.TEXT
+    if "BLOB" in t or len(t) == 0:
+        return DataType.BLOB
+    return DataType.REAL
+
+
+def parse_default(data_type: DataType, default: str) -> tuple[bool, GeneralValueTypes]:
+    """把 table_info 中的默认值（SQL 字面量）转换回来，表达式无法表示，视为没有默认值"""
+    if default.upper() == "NULL":
+        return True, None
+    if default.startswith("'") and default.endswith("'"):
+        # to_string 会原样使用首尾带单引号的字符串
+        return True, default
+    m = re.fullmatch(r"[xX]'([0-9a-fA-F]*)'", default)
+    if m is not None:
+        return True, bytes.fromhex(m.group(1))
+    try:
+        value = int(default)
+    except ValueError:
+        try:
+            value = float(default)
+        except ValueError:
+            return False, 0
+    if data_type == DataType.REAL:
+        value = float(value)
+    return True, value
+
+
+def reflect_columns(infos: tuple[ColumnInfo, ...], indexes: tuple[IndexInfo, ...],
+                    secure: set[str]) -> list[Column]:
+    # 只有单列的主键和唯一约束能用 Column 表示
+    pk_count = sum(1 for info in infos if info.pk > 0)
+    unique = {index.columns[0] for index in indexes
+              if index.unique and index.origin == "u" and not index.partial and len(index.columns) == 1}
+    columns = []
+    for info in infos:
+        data_type = affinity(info.type)
+        has_default, default = (False, 0) if info.default is None else parse_default(data_type, info.default)
+        columns.append(Column(
+            info.name, data_type,
+            primary_key=info.pk > 0 and pk_count == 1,
+            nullable=not info.notnull,
+            unique=info.name in unique,
+            has_default=has_default,
+            default=default,
+            secure=info.name in secure,
+        ))
+    return columns
+
+
+def table_class_name(table_name: str) -> str:
+    name = "".join(part.capitalize() for part in re.split(r"\W+|_", table_name))
+    if len(name) == 0 or not name[0].isalpha():
+        name = f"Table{name}"
+    return name
+
+
+def make_table(table_name: str, columns: list[Column]) -> Table:
+    """生成一个 Table 的子类并实例化，与 create_table 的列的顺序相同"""
+    namespace = {}
+    for column in columns:
+        attr = column.name
+        # 不能覆盖 Table 自己的字段
+        if attr in ("table", "all") or attr.startswith("_"):
+            attr = f"{attr}_"
+        namespace[attr] = column
+    cls = make_dataclass(table_class_name(table_name),
+                         [("table", str, field(default=table_name))],
+                         bases=(Table,), namespace=namespace)
+    return cls()
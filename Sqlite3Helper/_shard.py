@@ -0,0 +1,328 @@
+# coding: utf8
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Callable, Iterable, Sequence
+from itertools import islice
+from os import PathLike
+from typing import Any
+
+from ._column import Column
+from ._types_def import GeneralValueTypes
+from ._util_func import to_param
+from ._parallel import batched
+from ._where import Operand, Expression, is_aggregate, output_name
+from ._row import RowType, row_factory
+from ._worker import Sqlite3Worker
+
+
+def _key_bytes(value: GeneralValueTypes) -> bytes:
+    # 同一个值在任何进程中都要得到相同的结果，所以不能用 hash()
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf8")
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value).encode("utf8")
+
+
+def _type_rank(value: Any) -> int:
+    # SQLite 中不同类型的比较：NULL < 数字 < 文本 < BLOB
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    return 3
+
+
+def _parse_order_term(term: Column | str) -> tuple[str, bool, bool]:
+    """列名、是否降序、NULL 是否在前面，与 SQLite 的默认行为相同：升序时 NULL 在前"""
+    if isinstance(term, Column):
+        return term.name, False, True
+    words = term.upper().split()
+    desc = len(words) > 1 and words[1] == "DESC"
+    nulls_first = not desc
+    if "NULLS" in words[1:]:
+        nulls_first = words[-1] == "FIRST"
+    return term.split()[0], desc, nulls_first
+
+
+class _MergeKey(object):
+    """归并各分片已经排好序的结果时使用的排序键"""
+    __slots__ = ("values", "terms")
+
+    def __init__(self, values: list, terms: list[tuple[str, bool, bool]]):
+        self.values = values
+        self.terms = terms
+
+    def __lt__(self, other: _MergeKey) -> bool:
+        for a, b, (_, desc, nulls_first) in zip(self.values, other.values, self.terms):
+            if a is None or b is None:
+                if a is None and b is None:
+                    continue
+                return (a is None) == nulls_first
+            ra, rb = _type_rank(a), _type_rank(b)
+            if ra != rb:
+                return (ra < rb) != desc
+            if a != b:
+                return (a < b) != desc
+        return False
+
+
+class ShardedSqlite3Worker(object):
+    """
+    把同一组表按 shard_column 的值分散到多个数据库文件中，每个文件一个 Sqlite3Worker 。
+    默认按值的 crc32 取模分片，给出 boundaries 时按范围分片：第 i 个分片保存
+    boundaries[i-1] <= 值 < boundaries[i] 的行。
+    写操作发送到对应的分片，查询在多个线程中并行执行，再统一排序、去重和截取。
+    分片之间没有跨库事务，每个分片单独提交。
+    """
+
+    def __init__(
+            self,
+            db_names: Sequence[str | PathLike[str]],
+            shard_column: Column | str,
+            key: bytes = None,
+            fix_time: int = None,
+            fix_iv: bytes = None,
+            *,
+            boundaries: Sequence[GeneralValueTypes] = None,
+            max_workers: int = None,
+            **worker_options,
+    ):
+        self._is_closed = True
+        if len(db_names) == 0:
+            raise ValueError("db_names must not be empty")
+        if isinstance(shard_column, Column) and shard_column.secure:
+            raise ValueError("Secure column can not be used as shard column")
+        if boundaries is not None:
+            boundaries = list(boundaries)
+            if len(boundaries) != len(db_names) - 1:
+                raise ValueError(f"Length of boundaries must be {len(db_names) - 1}")
+            if boundaries != sorted(boundaries):
+                raise ValueError("boundaries must be sorted")
+
+        # 所有分片使用相同的 fix_time 和 fix_iv，条件中的加密值才能在每个分片上匹配
+        if key is not None:
+            fix_time = fix_time if fix_time is not None else int(time.time())
+            fix_iv = fix_iv if fix_iv is not None else os.urandom(16)
+
+        self._shard_column = shard_column
+        self._shard_name = shard_column.name if isinstance(shard_column, Column) else shard_column
+        self._boundaries = boundaries
+        # 查询在线程池中执行，每个分片同一时间只能有一个线程使用
+        worker_options["check_same_thread"] = False
+        self._shards = [Sqlite3Worker(db_name, key, fix_time, fix_iv, **worker_options) for db_name in db_names]
+        self._locks = [threading.Lock() for _ in db_names]
+        self._executor = ThreadPoolExecutor(max_workers or len(db_names), thread_name_prefix="Sqlite3Helper-shard")
+        self._is_closed = False
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def shards(self) -> tuple[Sqlite3Worker, ...]:
+        return tuple(self._shards)
+
+    def close(self):
+        if self._is_closed is False:
+            self._executor.shutdown()
+            for worker in self._shards:
+                worker.close()
+            self._is_closed = True
+
+    def shard_of(self, value: GeneralValueTypes) -> int:
+        """分片键的值所在的分片序号"""
+        value = self._shards[0]._check_and_convert(self._shard_column, value, encrypt=False)
+        value = to_param(value)
+        if value is None:
+            raise ValueError(f"Value of shard column {self._shard_name} must not be NULL")
+        if self._boundaries is not None:
+            return bisect_right(self._boundaries, value)
+        return zlib.crc32(_key_bytes(value)) % len(self._shards)
+
+    def _run(self, index: int, func: Callable[[Sqlite3Worker], Any]) -> Any:
+        with self._locks[index]:
+            return func(self._shards[index])
+
+    def _run_each(self, calls: dict[int, Callable[[Sqlite3Worker], Any]]) -> list:
+        """在线程池中并行执行，每个分片一个函数，结果按 calls 的顺序返回"""
+        futures = [self._executor.submit(self._run, i, func) for i, func in calls.items()]
+        return [future.result() for future in futures]
+
+    def _run_all(self, func: Callable[[Sqlite3Worker], Any], indexes: Iterable[int] = None) -> list:
+        indexes = range(len(self._shards)) if indexes is None else indexes
+        return self._run_each({i: func for i in indexes})
+
+    def _route(self, where: Expression | None) -> list[int] | None:
+        """条件是 分片键 = 值 时只需要访问一个分片，否则返回 None 表示所有分片"""
+        if not isinstance(where, Expression):
+            return None
+        if where.columns == (self._shard_name,) and where.sql == f"{self._shard_name} = ?":
+            return [self.shard_of(where.params[0])]
+        return None
+
+    def operand(self, column: Column | str) -> Operand:
+        return self._shards[0].operand(column)
+
+    def commit(self):
+        self._run_all(lambda w: w.commit())
+
+    def show_tables(self) -> list[str]:
+        return self._run(0, lambda w: w.show_tables())
+
+    def create_table(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.create_table(*args, **kwargs))[0]
+
+    def drop_table(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.drop_table(*args, **kwargs))[0]
+
+    def rename_table(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.rename_table(*args, **kwargs))[0]
+
+    def add_column(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.add_column(*args, **kwargs))[0]
+
+    def rename_column(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.rename_column(*args, **kwargs))[0]
+
+    def create_index(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.create_index(*args, **kwargs))[0]
+
+    def drop_index(self, *args, **kwargs) -> str:
+        return self._run_all(lambda w: w.drop_index(*args, **kwargs))[0]
+
+    def insert_many(self, table_name: str, columns: list[Column | str],
+                    values: Iterable[Sequence[GeneralValueTypes]],
+                    *, commit: bool = True, batch_size: int = 10000) -> str:
+        """
+        每次取 batch_size 行，按每行中分片键的值分组，各分片并行用 executemany 插入，
+        内存中最多只有一批数据。columns 中必须包含分片键
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        names = Sqlite3Worker._column_names(columns)
+        if self._shard_name not in names:
+            raise ValueError(f"columns must contain shard column {self._shard_name}")
+        key_index = names.index(self._shard_name)
+
+        for chunk in batched(values, batch_size):
+            groups: dict[int, list] = {}
+            for row in chunk:
+                groups.setdefault(self.shard_of(row[key_index]), []).append(row)
+            self._run_each({i: (lambda w, rows=rows: w.insert_many(table_name, columns, rows, commit=commit))
+                            for i, rows in groups.items()})
+        # 各分片执行的语句相同
+        return self._shards[0].insert_many(table_name, columns, [], execute=False)
+
+    def insert_into(self, table_name: str, columns: list[Column | str],
+                    values: list[list[GeneralValueTypes]],
+                    *, commit: bool = True) -> str:
+        """与 insert_many 相同，各分片使用参数绑定插入，返回带占位符的语句"""
+        return self.insert_many(table_name, columns, values, commit=commit)
+
+    def _check_new_values(self, new_values: list[tuple[Column | str, GeneralValueTypes]]):
+        for column, _ in new_values:
+            name = column.name if isinstance(column, Column) else column
+            if name == self._shard_name:
+                raise ValueError(f"Shard column {self._shard_name} can not be updated")
+
+    def update(self, table_name: str, new_values: list[tuple[Column | str, GeneralValueTypes]],
+               where: Expression = None, *, commit: bool = True) -> str:
+        """条件是 分片键 = 值 时只更新对应的分片，否则在所有分片上执行，不能修改分片键"""
+        self._check_new_values(new_values)
+        return self._run_all(lambda w: w.update(table_name, new_values, where, commit=commit),
+                             self._route(where))[0]
+
+    def delete_from(self, table_name: str, where: Expression = None, *, commit: bool = True) -> str:
+        return self._run_all(lambda w: w.delete_from(table_name, where, commit=commit), self._route(where))[0]
+
+    def select(self, table_name: str, columns: list[Column | str], distinct: bool = False,
+               where: Expression = None,
+               order_by: list[Column | str] | Column | str = None,
+               limit: int = None, offset: int = None,
+               *, row_type: RowType = "list",
+               group_by: list[Column | str] | Column | str = None,
+               having: Expression = None) -> tuple[str, list]:
+        """
+        在各分片上并行查询，结果按 order_by 归并排序后再应用 distinct 、offset 和 limit 。
+        每个分片最多取 limit + offset 行，加密的列不能用于排序。
+        各分片的聚合结果无法直接合并，不支持聚合函数和 group_by ，总行数用 count
+        """
+        if group_by is not None or having is not None:
+            raise ValueError("group_by and having are not supported by sharded select")
+        for column in columns:
+            if is_aggregate(column):
+                raise ValueError(f"Aggregate column {column} is not supported by sharded select, "
+                                 f"use count or query each shard")
+        if order_by is None:
+            order_by = []
+        elif isinstance(order_by, str):
+            order_by = [term.strip() for term in order_by.split(",")]
+        elif not isinstance(order_by, list):
+            order_by = [order_by]
+        terms = [_parse_order_term(term) for term in order_by]
+
+        # SELECT * 时取第一个分片的列名，排序列不在查询的列中时额外查出来，最后再去掉
+        query_columns = list(columns)
+        if len(query_columns) == 0:
+            query_columns = [info.name for info in self._run(0, lambda w: w.table_columns(table_name))]
+        names = list(Sqlite3Worker._column_names(query_columns))
+        secure = {c.name for c in query_columns if isinstance(c, Column) and c.secure}
+        col_count = len(names)
+        key_indexes = []
+        for name, _, _ in terms:
+            if name in secure:
+                raise ValueError(f"Secure column {name} can not be used in order_by of sharded select")
+            if name not in names:
+                names.append(name)
+                query_columns.append(name)
+            key_indexes.append(names.index(name))
+
+        shard_limit = None if limit is None else limit + (offset or 0)
+        order_terms = [term.name if isinstance(term, Column) else term for term in order_by] or None
+        results = self._run_all(lambda w: w.select(table_name, query_columns, distinct, where, order_terms,
+                                                   shard_limit, None), self._route(where))
+        statement = results[0][0]
+
+        parts = [rows for _, rows in results]
+        if len(terms) != 0:
+            rows = heapq.merge(*parts, key=lambda row: _MergeKey([row[i] for i in key_indexes], terms))
+        else:
+            rows = (row for part in parts for row in part)
+        if len(query_columns) != col_count:
+            rows = (row[:col_count] for row in rows)
+        if distinct:
+            rows = self._unique(rows)
+        start = offset or 0
+        rows = list(islice(rows, start, None if limit is None else start + limit))
+
+        if row_type != "list":
+            # 与 Sqlite3Worker 相同，有别名时以别名为键
+            make = row_factory(row_type, [output_name(name) for name in names[:col_count]])
+            rows = [make(row) for row in rows]
+        return statement, rows
+
+    def count(self, table_name: str, where: Expression = None) -> int:
+        return sum(self._run_all(lambda w: w.count(table_name, where), self._route(where)))
+
+    def exists(self, table_name: str, where: Expression = None) -> bool:
+        return any(self._run_all(lambda w: w.exists(table_name, where), self._route(where)))
+
+    @staticmethod
+    def _unique(rows: Iterable[list]) -> Iterable[list]:
+        seen = set()
+        for row in rows:
+            key = tuple(row)
+            if key not in seen:
+                seen.add(key)
+                yield row
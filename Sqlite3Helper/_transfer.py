@@ -0,0 +1,99 @@
+# coding: utf8
+from __future__ import annotations
+
+import csv
+import json
+import time
+from collections.abc import Iterator, Sequence
+from os import PathLike
+from typing import IO, NamedTuple
+
+from ._column import Column
+from ._types_def import DataType, GeneralValueTypes
+from ._util_func import implicitly_convert
+
+PathOrFile = str | PathLike[str] | IO[str]
+
+
+class TransferReport(NamedTuple):
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class ProgressTimer(object):
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.rows = 0
+
+    def report(self) -> TransferReport:
+        return TransferReport(self.rows, time.perf_counter() - self._start)
+
+
+def parse_value(column: Column | str, value: GeneralValueTypes) -> GeneralValueTypes:
+    """
+    把从文本格式中读到的值转换为列的类型，BLOB 以十六进制保存，
+    CSV 中的空字符串对于 TEXT 以外的列视为 NULL
+    """
+    if not isinstance(column, Column):
+        return value
+    data_type = column.data_type
+    if isinstance(value, str):
+        if data_type == DataType.TEXT:
+            return value
+        if value == "" or data_type == DataType.NULL:
+            return None
+        if data_type == DataType.INTEGER:
+            return int(value)
+        if data_type == DataType.REAL:
+            return float(value)
+        if data_type == DataType.BLOB:
+            return bytes.fromhex(value)
+    return implicitly_convert(data_type, value)
+
+
+def format_value(value: GeneralValueTypes) -> GeneralValueTypes:
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def read_csv_rows(f: IO[str], columns: Sequence[Column | str], names: Sequence[str],
+                  header: bool, delimiter: str) -> Iterator[list]:
+    reader = csv.reader(f, delimiter=delimiter)
+    indexes = list(range(len(columns)))
+    if header:
+        head = next(reader, None)
+        if head is None:
+            return
+        missing = [name for name in names if name not in head]
+        if len(missing) != 0:
+            raise ValueError(f"Columns not found in header: {', '.join(missing)}")
+        indexes = [head.index(name) for name in names]
+
+    for record in reader:
+        if len(record) == 0:
+            continue
+        yield [parse_value(column, record[i]) for column, i in zip(columns, indexes)]
+
+
+def read_jsonl_rows(f: IO[str], columns: Sequence[Column | str], names: Sequence[str]) -> Iterator[list]:
+    for line in f:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        record = json.loads(line)
+        yield [parse_value(column, record.get(name)) for column, name in zip(columns, names)]
+
+
+def format_csv_row(row: Sequence) -> list:
+    return ["" if value is None else format_value(value) for value in row]
+
+
+def format_jsonl_row(names: Sequence[str], row: Sequence) -> str:
+    record = {name: format_value(value) for name, value in zip(names, row)}
+    return f"{json.dumps(record, ensure_ascii=False)}\n"
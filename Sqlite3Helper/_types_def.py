@@ -1,7 +1,10 @@
 # coding: utf8
 from __future__ import annotations
 from enum import Enum
-from ._crypto import NotRandomFernet
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ._crypto import NotRandomFernet
 
 
 class DataType(Enum):
@@ -26,6 +29,10 @@ class BlobType(object):
     def __str__(self):
         return f"X'{self._data.hex()}'"
 
+    @property
+    def data(self) -> bytes:
+        return self._data
+
     def encrypt(self, fernet: NotRandomFernet) -> BlobType:
         if fernet is None:
             raise ValueError("Key is not set")
@@ -1,4 +1,6 @@
 # coding: utf8
+from contextlib import contextmanager
+
 from ._types_def import (
     DataType, GeneralValueTypes, SpecialValueTypes,
     NullType, BlobType,
@@ -34,3 +36,35 @@ def to_string(value: GeneralValueTypes):
         value = BlobType(value)
 
     return str(value)
+
+
+def to_param(value: GeneralValueTypes):
+    """转换为可以绑定到 ? 占位符上的值，语义与 to_string 保持一致"""
+    if value is None or isinstance(value, NullType):
+        return None
+    if isinstance(value, BlobType):
+        return value.data
+    if isinstance(value, str):
+        # to_string 会把首尾都是单引号的字符串视为已经转义过的字面量，
+        # 这里还原成原本的字符串，保证两种方式写入的数据相同
+        if len(value) >= 2 and value.startswith("'") and value.endswith("'"):
+            value = value[1:-1].replace("''", "'")
+
+    return value
+
+
+@contextmanager
+def open_file(path_or_file, mode: str, encoding: str = None):
+    """
+    传入路径时打开并在结束后关闭，传入文件对象时直接使用。
+    文本模式按 encoding 打开并且不转换换行符（csv 模块要求），二进制模式忽略 encoding
+    """
+    if hasattr(path_or_file, "read") or hasattr(path_or_file, "write"):
+        yield path_or_file
+        return
+    if "b" in mode:
+        f = open(path_or_file, mode)
+    else:
+        f = open(path_or_file, mode, encoding=encoding, newline="")
+    with f:
+        yield f
@@ -1,39 +1,106 @@
 # coding: utf8
 from __future__ import annotations
 import os
+import re
 import time
 import sqlite3
 from enum import Enum
-from ._crypto import NotRandomFernet
+from typing import TYPE_CHECKING
+from ._crypto import get_fernet, new_fernet
 from ._types_def import (
     GeneralValueTypes, BlobType,
 )
-from ._util_func import to_string, implicitly_convert
+from ._util_func import to_string, to_param, implicitly_convert
 from ._column import Column
 
+if TYPE_CHECKING:
+    from ._crypto import NotRandomFernet
+
 
 class Expression(object):
+    """
+    条件表达式，SQL 片段中的值以 ? 占位，值本身保存在 params 中，执行的时候再绑定，
+    转为字符串时会把值以字面量的形式填回去，得到完整的语句。
+    """
+
+    def __init__(self, expr: str, params: list = None):
+        # 由 Operand 生成时记录条件涉及的列，用于索引建议
+        self._columns = ()
+        if params is None:
+            # 没有参数的时候原样保留，不把其中的 ? 当作占位符
+            self._parts = [expr]
+            self._params = []
+        else:
+            self._parts = expr.split("?")
+            self._params = list(params)
+            if len(self._parts) != len(self._params) + 1:
+                raise ValueError(f"Expression has {len(self._parts) - 1} placeholders, "
+                                 f"but {len(self._params)} params are given")
+
+    @classmethod
+    def _from_parts(cls, parts: list[str], params: list, columns: tuple[str, ...] = ()) -> Expression:
+        expression = cls.__new__(cls)
+        expression._parts = parts
+        expression._params = params
+        expression._columns = columns
+        return expression
+
+    @staticmethod
+    def _to_expression(expression: Expression | str) -> Expression:
+        if isinstance(expression, Expression):
+            return expression
+        return Expression(str(expression))
+
+    def _join(self, sep: str, expression: Expression | str) -> Expression:
+        other = self._to_expression(expression)
+        parts = [*self._parts[:-1], f"{self._parts[-1]}{sep}{other._parts[0]}", *other._parts[1:]]
+        columns = self._columns + tuple(c for c in other._columns if c not in self._columns)
+        return self._from_parts(parts, self._params + other._params, columns)
+
+    def _wrap(self, prefix: str, suffix: str) -> Expression:
+        parts = list(self._parts)
+        parts[0] = f"{prefix}{parts[0]}"
+        parts[-1] = f"{parts[-1]}{suffix}"
+        return self._from_parts(parts, list(self._params), self._columns)
+
+    @property
+    def sql(self) -> str:
+        """带 ? 占位符的 SQL 片段"""
+        return "?".join(self._parts)
+
+    @property
+    def params(self) -> list:
+        """与 sql 中的占位符一一对应的值"""
+        return list(self._params)
 
-    def __init__(self, expr: str):
-        self._expr = expr
+    @property
+    def columns(self) -> tuple[str, ...]:
+        """通过 Operand 参与条件的列名"""
+        return self._columns
 
     def __str__(self):
-        return self._expr
+        if len(self._params) == 0:
+            return self._parts[0]
+        pieces = [self._parts[0]]
+        for param, part in zip(self._params, self._parts[1:]):
+            pieces.append(to_string(param))
+            pieces.append(part)
+        return "".join(pieces)
 
     def and_(self, expression: Expression):
-        return Expression(f"{self._expr} AND {expression}")
+        return self._join(" AND ", expression)
 
     def or_(self, expression: Expression, high_priority: bool = False):
-        statement = f"{self._expr} OR {expression}"
+        statement = self._join(" OR ", expression)
         if high_priority:
-            statement = f"({statement})"
-        return Expression(statement)
+            statement = statement._wrap("(", ")")
+        return statement
 
     def exists(self, not_: bool = False):
         mark = "EXISTS"
         if not_:
             mark = "NOT EXISTS"
-        return Expression(f"{mark} ({self._expr})")
+        return self._wrap(f"{mark} (", ")")
 
 
 class Operand(object):
@@ -44,75 +111,109 @@ class Operand(object):
             key: bytes = None,
             fix_time: int = None,
             fix_iv: bytes = None,
+            *,
+            fernet: NotRandomFernet = None,
     ):
         self._column = column
         self._key = key
         self._fix_time = fix_time
         self._fix_iv = fix_iv
+        # 可以直接传入 Sqlite3Worker 已经构造好的 fernet，见 Sqlite3Worker.operand
+        self._fernet = fernet
         self._name = column.name if isinstance(column, Column) else column
 
+    def _get_fernet(self) -> NotRandomFernet | None:
+        if self._fernet is None and self._key is not None:
+            if self._fix_time is not None and self._fix_iv is not None:
+                self._fernet = get_fernet(self._key, self._fix_time, self._fix_iv)
+            else:
+                # 没有固定下来的时间和 iv 不放进共享缓存，只在这个对象内复用
+                fix_time = self._fix_time if self._fix_time is not None else int(time.time())
+                fix_iv = self._fix_iv if self._fix_iv is not None else os.urandom(16)
+                self._fernet = new_fernet(self._key, fix_time, fix_iv)
+        return self._fernet
+
     def _try_encrypt(self, value: GeneralValueTypes) -> GeneralValueTypes:
         if isinstance(self._column, Column):
             # 这里主要为了转换 BlobType
             value = implicitly_convert(self._column.data_type, value)
-            if self._key is not None and self._column.secure and isinstance(value, BlobType):
-                fix_time = self._fix_time if self._fix_time is not None else int(time.time())
-                fix_iv = self._fix_iv if self._fix_iv is not None else os.urandom(16)
-                value = value.encrypt(NotRandomFernet(self._key, fix_time, fix_iv))
+            if self._column.secure and isinstance(value, BlobType):
+                fernet = self._get_fernet()
+                if fernet is not None:
+                    value = value.encrypt(fernet)
 
         return value
 
+    def _expression(self, expr: str, params: list = None) -> Expression:
+        expression = Expression(expr, params)
+        expression._columns = (self._name,)
+        return expression
+
+    def _compare(self, op: str, value: GeneralValueTypes) -> Expression:
+        return self._expression(f"{self._name} {op} ?", [to_param(value)])
+
     def equal_to(self, value: GeneralValueTypes, not_: bool = False):
         value = self._try_encrypt(value)
         op = "!=" if not_ else "="
-        return Expression(f"{self._name} {op} {to_string(value)}")
+        return self._compare(op, value)
+
+    def equal_to_column(self, column: Column | str, not_: bool = False) -> Expression:
+        """与另一列比较，比如 JOIN 的 ON 条件，不绑定参数"""
+        name = column.name if isinstance(column, Column) else column
+        op = "!=" if not_ else "="
+        expression = Expression(f"{self._name} {op} {name}")
+        expression._columns = (self._name, name)
+        return expression
 
     # 上面的相等比较可能会用在字符串或者二进制数据上，所以进行隐式转换并尝试加密
     # 对于不等比较一般只用于数字，差别不大，所以不进行隐式转换
 
     def less_than(self, value: GeneralValueTypes):
-        return Expression(f"{self._name} < {to_string(value)}")
+        return self._compare("<", value)
 
     def greater_than(self, value: GeneralValueTypes):
-        return Expression(f"{self._name} > {to_string(value)}")
+        return self._compare(">", value)
 
     def less_equal(self, value: GeneralValueTypes):
-        return Expression(f"{self._name} <= {to_string(value)}")
+        return self._compare("<=", value)
 
     def greater_equal(self, value: GeneralValueTypes):
-        return Expression(f"{self._name} >= {to_string(value)}")
+        return self._compare(">=", value)
 
     def between(self, minimum: GeneralValueTypes, maximum: GeneralValueTypes, not_: bool = False):
         mark = "BETWEEN"
         if not_:
             mark = "NOT BETWEEN"
-        return Expression(f"{self._name} {mark} {to_string(minimum)} AND {to_string(maximum)}")
+        return self._expression(f"{self._name} {mark} ? AND ?", [to_param(minimum), to_param(maximum)])
 
     def in_(self, values: list[GeneralValueTypes], not_: bool = False):
         # in 也算是相等比较的一种，所以也给隐私转换并尝试加密了
-        values_str = ", ".join([to_string(self._try_encrypt(value)) for value in values])
+        params = [to_param(self._try_encrypt(value)) for value in values]
+        placeholders = ", ".join(["?"] * len(params))
         mark = "IN"
         if not_:
             mark = "NOT IN"
-        return Expression(f"{self._name} {mark} ({values_str})")
+        return self._expression(f"{self._name} {mark} ({placeholders})", params)
 
     def like(self, regx: str, escape: str = "", not_: bool = False):
         head = "LIKE"
         if not_:
             head = "NOT LIKE"
-        body = f"{head} {to_string(regx)}"
+        body = f"{head} ?"
+        params = [to_param(regx)]
         if len(escape) != 0:
-            body = f"{body} ESCAPE {to_string(escape)}"
-        return Expression(f"{self._name} {body}")
+            body = f"{body} ESCAPE ?"
+            params.append(to_param(escape))
+        return self._expression(f"{self._name} {body}", params)
 
     def is_null(self, not_: bool = False):
         mark = "IS NULL"
         if not_:
             mark = "IS NOT NULL"
-        return Expression(f"{self._name} {mark}")
+        return self._expression(f"{self._name} {mark}")
 
     def glob(self, regx: str):
-        return Expression(f"{self._name} GLOB {to_string(regx)}")
+        return self._expression(f"{self._name} GLOB ?", [to_param(regx)])
 
 
 class SortOption(Enum):
@@ -140,3 +241,66 @@ def order(
             name = f"{name} {null_option.value}"
 
     return name
+
+
+class Aggregate(object):
+    """
+    聚合函数，结果是可以直接放在 select 的 columns 中的字符串，也可以用 Operand 构造 having 的条件。
+    alias 不为 None 时加上 AS 别名，row_type 为 dict 、record 时以别名作为键。
+    加密的列在数据库中是密文，除了 count 以外对它们聚合没有意义。
+    """
+
+    @staticmethod
+    def _call(func: str, column: Column | str, distinct: bool, alias: str | None, *args: str) -> str:
+        name = column.name if isinstance(column, Column) else str(column)
+        if distinct:
+            name = f"DISTINCT {name}"
+        expr = f"{func}({', '.join([name, *args])})"
+        if alias is not None:
+            expr = f"{expr} AS {alias}"
+        return expr
+
+    @staticmethod
+    def count(column: Column | str = "*", distinct: bool = False, alias: str = None) -> str:
+        return Aggregate._call("count", column, distinct, alias)
+
+    @staticmethod
+    def sum(column: Column | str, distinct: bool = False, alias: str = None) -> str:
+        return Aggregate._call("sum", column, distinct, alias)
+
+    @staticmethod
+    def avg(column: Column | str, distinct: bool = False, alias: str = None) -> str:
+        return Aggregate._call("avg", column, distinct, alias)
+
+    @staticmethod
+    def min(column: Column | str, alias: str = None) -> str:
+        return Aggregate._call("min", column, False, alias)
+
+    @staticmethod
+    def max(column: Column | str, alias: str = None) -> str:
+        return Aggregate._call("max", column, False, alias)
+
+    @staticmethod
+    def group_concat(column: Column | str, separator: str = None,
+                     distinct: bool = False, alias: str = None) -> str:
+        if separator is None:
+            return Aggregate._call("group_concat", column, distinct, alias)
+        if distinct:
+            raise ValueError("group_concat with DISTINCT can not have a separator")
+        return Aggregate._call("group_concat", column, False, alias, to_string(separator))
+
+
+_ALIAS_PATTERN = re.compile(r"\s+AS\s+(\w+)\s*$", re.IGNORECASE)
+# SQLite 内置的聚合函数，min 和 max 有多个参数时不是聚合函数，这里不区分
+_AGGREGATE_PATTERN = re.compile(r"\b(?:count|sum|total|avg|min|max|group_concat)\s*\(", re.IGNORECASE)
+
+
+def is_aggregate(column: Column | str) -> bool:
+    """列是否调用了聚合函数，比如 Aggregate 生成的列"""
+    return isinstance(column, str) and _AGGREGATE_PATTERN.search(column) is not None
+
+
+def output_name(name: str) -> str:
+    """结果中的列名，有 AS 别名时为别名"""
+    m = _ALIAS_PATTERN.search(name)
+    return name if m is None else m.group(1)
@@ -4,22 +4,36 @@ from __future__ import annotations
 import os
 import sqlite3
 import time
+from time import perf_counter
+from collections import deque
+from contextlib import contextmanager
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from os import PathLike
 from types import NoneType
-try:
-    from cryptography.fernet import InvalidToken
-except ImportError:
-    class InvalidToken(Exception):
-        pass
+from typing import TYPE_CHECKING, Any
 
-from ._crypto import NotRandomFernet
+from ._crypto import get_fernet, invalid_token
 from ._types_def import (
     DataType, GeneralValueTypes,
     NullType, BlobType,
 )
-from ._util_func import to_string, implicitly_convert
-from ._column import Column
-from ._where import Operand, Expression
+from ._util_func import to_string, to_param, implicitly_convert, open_file
+from ._column import Column, Table
+from ._where import Operand, Expression, Aggregate, output_name
+from ._join import Join
+from ._cache import StatementCache, CacheInfo, ResultCache, ResultCacheInfo, CachedRows
+from ._parallel import CryptoExecutor, batched
+from ._pragma import PRAGMA_NAMES, pragma_statements
+from ._instrument import Instrumentation, StatementStats, BeforeHook, AfterHook
+from ._index import QueryPlanStep, IndexAdvice, suggest_index_name
+from ._row import RowType, row_factory
+from ._columnar import ColumnArray, ColumnBuffer, load_numpy, iter_column_rows
+from ._schema import ColumnInfo, IndexInfo, SchemaCatalog, reflect_columns, make_table
+from ._blob import BinaryPathOrFile, check_blobopen, remaining_size, copy_stream
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from ._transfer import PathOrFile, TransferReport
 
 
 class Sqlite3Worker(object):
@@ -30,19 +44,66 @@ class Sqlite3Worker(object):
             key: bytes = None,
             fix_time: int = None,
             fix_iv: bytes = None,
+            *,
+            check_same_thread: bool = True,
+            statement_cache_size: int = 128,
+            crypto_executor: str | Executor = None,
+            crypto_workers: int = None,
+            profile: str = None,
+            journal_mode: str = None,
+            synchronous: str | int = None,
+            cache_size: int = None,
+            mmap_size: int = None,
+            temp_store: str | int = None,
+            page_size: int = None,
+            busy_timeout: int = None,
+            instrument: bool = False,
+            slow_query_threshold: float = None,
+            result_cache: ResultCache = None,
     ):
         self._db_name = db_name
-        self._conn = sqlite3.connect(db_name)
+        self._is_closed = True
+        # 先检查所有参数再建立连接
+        pragmas = pragma_statements(
+            profile, page_size=page_size, journal_mode=journal_mode, synchronous=synchronous,
+            cache_size=cache_size, mmap_size=mmap_size, temp_store=temp_store, busy_timeout=busy_timeout,
+        )
+        self._statement_cache = StatementCache(statement_cache_size)
+        # check_same_thread 为 False 时，由调用者保证同一时间只有一个线程使用该对象
+        # sqlite3 内部的预编译语句缓存至少保持默认的 128 ，关掉语句缓存时参数绑定的语句仍然不用重新编译
+        self._conn = sqlite3.connect(db_name, check_same_thread=check_same_thread,
+                                     cached_statements=max(statement_cache_size, 128))
         self._cursor = self._conn.cursor()
         self._is_closed = False
+        self._crypto_executor = None
+        # 为 None 时不做任何统计，设置了慢查询阈值时自动开启
+        self._instrument = None
+        if instrument or slow_query_threshold is not None:
+            self._instrument = Instrumentation(slow_query_threshold)
         self._fernet = None
+        # 最近用到的条件，用于索引建议：(表名, 条件中的列, 语句, 参数)
+        self._recent_filters = deque(maxlen=64)
+        # 事务嵌套深度，大于 0 时各方法的 commit 参数不再单独提交
+        self._tx_depth = 0
+        self._batch_size = None
+        self._batch_mode = "DEFERRED"
+        self._batch_count = 0
+        # 查询结果缓存，写过但还没提交的表，在提交或回滚时再清除一次
+        self._result_cache = result_cache
+        self._dirty_tables = set()
+        self._catalog = SchemaCatalog()
         if key is not None:
             fix_time = fix_time if fix_time is not None else int(time.time())
             fix_iv = fix_iv if fix_iv is not None else os.urandom(16)
             try:
-                self._fernet = NotRandomFernet(key, fix_time, fix_iv)
+                self._fernet = get_fernet(key, fix_time, fix_iv)
             except ValueError:
                 pass
+        # "thread" 或 "process"，也可以传入现成的 Executor，为 None 时在当前线程逐个加解密
+        if crypto_executor is not None:
+            self._crypto_executor = CryptoExecutor(crypto_executor, crypto_workers)
+        for statement in pragmas:
+            self._execute(statement)
 
     def __del__(self):
         self.close()
@@ -55,16 +116,216 @@ class Sqlite3Worker(object):
         if self._is_closed is False:
             self._cursor.close()
             self._conn.close()
+            if self._crypto_executor is not None:
+                self._crypto_executor.shutdown()
             self._is_closed = True
 
     def commit(self):
         self._conn.commit()
+        self._settle()
+
+    def pragma(self, name: str) -> str | int:
+        """读取 PRAGMA 当前实际生效的值"""
+        if name not in PRAGMA_NAMES:
+            raise ValueError(f"Unsupported pragma: {name}")
+        self._execute(f"PRAGMA {name};")
+        return self._cursor.fetchone()[0]
+
+    def pragmas(self) -> dict[str, str | int]:
+        return {name: self.pragma(name) for name in PRAGMA_NAMES}
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._tx_depth > 0
+
+    def _commit_if(self, commit: bool):
+        if self._tx_depth == 0:
+            if commit:
+                self._conn.commit()
+                self._settle()
+            return
+
+        # 在 transaction 中不单独提交，batch 模式下每 N 条语句提交一次
+        # 有保存点未释放的时候不能提交，留到下一条语句再判断
+        if self._batch_size is not None:
+            self._batch_count += 1
+            if self._batch_count >= self._batch_size and self._tx_depth == 1:
+                self._conn.commit()
+                self._settle()
+                self._execute(f"BEGIN {self._batch_mode};")
+                self._batch_count = 0
+
+    @contextmanager
+    def transaction(self, mode: str = "DEFERRED"):
+        """
+        在 with 块中的写操作不再单独提交，正常退出时提交，出现异常时回滚。
+        mode 可以是 DEFERRED、IMMEDIATE 或 EXCLUSIVE，嵌套使用时以保存点实现。
+        """
+        mode = mode.upper()
+        if mode not in ("DEFERRED", "IMMEDIATE", "EXCLUSIVE"):
+            raise ValueError(f"Unknown transaction mode: {mode}")
+
+        if self._tx_depth > 0:
+            savepoint = f"sqlite3helper_sp{self._tx_depth}"
+            self._execute(f"SAVEPOINT {savepoint};")
+            self._tx_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._execute(f"ROLLBACK TO {savepoint};")
+                self._execute(f"RELEASE {savepoint};")
+                # 外层事务还没结束，不清空记录的表
+                self._settle(clear=False)
+                raise
+            else:
+                self._execute(f"RELEASE {savepoint};")
+            finally:
+                self._tx_depth -= 1
+            return
 
-    def _execute(self, statement: str):
+        # 之前用 commit=False 留下的修改先提交掉，不混进这个事务里
+        if self._conn.in_transaction:
+            self._conn.commit()
+        self._execute(f"BEGIN {mode};")
+        self._tx_depth = 1
         try:
-            self._cursor.execute(statement)
+            yield self
+        except BaseException:
+            self._conn.rollback()
+            raise
+        else:
+            self._conn.commit()
+        finally:
+            self._tx_depth = 0
+            self._settle()
+
+    @contextmanager
+    def batch(self, size: int, mode: str = "DEFERRED"):
+        """
+        与 transaction 相同，但每执行 size 条写语句就提交一次。
+        出现异常时只回滚最后一批未提交的修改。
+        """
+        if size <= 0:
+            raise ValueError("size must be positive")
+        if self._tx_depth > 0:
+            raise ValueError("batch cannot be nested in a transaction")
+
+        self._batch_size = size
+        self._batch_mode = mode.upper()
+        self._batch_count = 0
+        try:
+            with self.transaction(mode):
+                yield self
+        finally:
+            self._batch_size = None
+            self._batch_count = 0
+
+    def statement_cache_info(self) -> CacheInfo:
+        return self._statement_cache.info()
+
+    def result_cache_info(self) -> ResultCacheInfo | None:
+        return None if self._result_cache is None else self._result_cache.info()
+
+    def _touch(self, *tables: str):
+        """清除这些表的查询结果缓存，在写操作执行之前调用"""
+        if self._result_cache is None:
+            return
+        self._result_cache.invalidate(*tables)
+        self._dirty_tables.update(tables)
+
+    def _touch_schema(self, *tables: str):
+        self._catalog.clear()
+        self._touch("sqlite_schema", *tables)
+
+    def _settle(self, clear: bool = True):
+        # 事务中查询到的结果可能包含未提交的修改，提交或回滚之后都要再清除一次
+        if self._result_cache is None or len(self._dirty_tables) == 0:
+            return
+        self._result_cache.invalidate(*self._dirty_tables)
+        if clear:
+            self._dirty_tables.clear()
+
+    def _get_instrument(self) -> Instrumentation:
+        if self._instrument is None:
+            self._instrument = Instrumentation()
+        return self._instrument
+
+    def add_hook(self, before: BeforeHook = None, after: AfterHook = None):
+        """
+        每条语句执行前调用 before(statement, parameters)，
+        执行后调用 after(statement, parameters, elapsed, rowcount)，
+        查询语句的 rowcount 为 -1，executemany 的 parameters 为 None
+        """
+        self._get_instrument().add_hook(before, after)
+
+    def remove_hook(self, hook: BeforeHook | AfterHook):
+        if self._instrument is not None:
+            self._instrument.remove_hook(hook)
+
+    def stats(self) -> list[StatementStats]:
+        """按语句结构汇总的执行次数、时间和行数，按总时间从多到少排序"""
+        if self._instrument is None:
+            return []
+        return self._instrument.stats()
+
+    def timings(self) -> dict[str, float]:
+        """加密（encrypt）、解密（decrypt）、生成语句（build）所花的总时间"""
+        if self._instrument is None:
+            return {}
+        return self._instrument.timings()
+
+    def reset_stats(self):
+        if self._instrument is not None:
+            self._instrument.reset()
+
+    def _execute(self, statement: str, parameters: Sequence = (), *, cursor: sqlite3.Cursor = None):
+        if cursor is None:
+            cursor = self._cursor
+        instrument = self._instrument
+        if instrument is not None:
+            instrument.before(statement, parameters)
+            start = perf_counter()
+        try:
+            cursor.execute(statement, parameters)
         except sqlite3.Error as e:
             raise sqlite3.Error(f"Error name: {e.sqlite_errorname};\nError statement: {statement}")
+        if instrument is not None:
+            instrument.after(statement, parameters, perf_counter() - start, cursor.rowcount)
+
+    def _executemany(self, statement: str, parameters: Iterable[Sequence]):
+        # 参数是逐行检查的，出错时前面的行已经执行了，用保存点撤销，与 insert_into 出错时一行都不写入一致。
+        # 在 transaction 中异常可能被调用者捕获而继续提交，因此同样要用保存点。
+        # 直接用连接执行，不计入统计，也不调用钩子
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN;")
+        self._conn.execute("SAVEPOINT sqlite3helper_many;")
+        try:
+            self._run_many(statement, parameters)
+        except BaseException:
+            self._conn.execute("ROLLBACK TO sqlite3helper_many;")
+            raise
+        finally:
+            self._conn.execute("RELEASE sqlite3helper_many;")
+
+    def _run_many(self, statement: str, parameters: Iterable[Sequence]):
+        instrument = self._instrument
+        if instrument is not None:
+            instrument.before(statement, None)
+            start = perf_counter()
+        try:
+            self._cursor.executemany(statement, parameters)
+        except sqlite3.Error as e:
+            raise sqlite3.Error(f"Error name: {e.sqlite_errorname};\nError statement: {statement}")
+        if instrument is not None:
+            instrument.after(statement, None, perf_counter() - start, self._cursor.rowcount)
+
+    def _build_statement(self, key: tuple, build: Callable[[], str]) -> str:
+        if self._instrument is None:
+            return self._statement_cache.get(key, build)
+        start = perf_counter()
+        statement = self._statement_cache.get(key, build)
+        self._instrument.add_time("build", perf_counter() - start)
+        return statement
 
     @staticmethod
     def _check_data_type(data_type: DataType, allow_null: bool, value: GeneralValueTypes) -> bool:
@@ -93,10 +354,58 @@ class Sqlite3Worker(object):
         # 如果有 secure，则这里的类型要么是 BlobType，要么是 NULL
         # 尽管判断不是 NULL 也可以，但是为了更严谨些，还是判断 BlobType 吧
         if column.secure and isinstance(value, BlobType):
+            if self._instrument is None:
+                return value.encrypt(self._fernet)
+            start = perf_counter()
             value = value.encrypt(self._fernet)
+            self._instrument.add_time("encrypt", perf_counter() - start)
+
+        return value
+
+    def _check_and_convert(self, column: Column | str, value: GeneralValueTypes,
+                           encrypt: bool = True) -> GeneralValueTypes:
+        if isinstance(column, Column):
+            if not self._check_data_type(column.data_type, column.nullable, value):
+                raise ValueError(f"Type of {column.name} must be {column.data_type}, found {type(value)}")
+            value = implicitly_convert(column.data_type, value)
+            if encrypt:
+                value = self._try_encrypt(column, value)
 
         return value
 
+    def _convert_rows(self, columns: list[Column | str],
+                      values: Iterable[Sequence[GeneralValueTypes]]) -> Iterator[list]:
+        """逐行检查类型并转换，需要加密的值在有 crypto_executor 的时候按批并行加密"""
+        col_count = len(columns)
+        secure_indexes = []
+        if self._crypto_executor is not None and self._fernet is not None:
+            secure_indexes = self._secure_indexes(columns)
+
+        if len(secure_indexes) == 0:
+            for value_row in values:
+                if len(value_row) != col_count:
+                    raise ValueError(f"Length of values must be {col_count}")
+                yield [self._check_and_convert(column, value) for column, value in zip(columns, value_row)]
+            return
+
+        for chunk in batched(values, self._crypto_executor.batch_size):
+            rows = []
+            for value_row in chunk:
+                if len(value_row) != col_count:
+                    raise ValueError(f"Length of values must be {col_count}")
+                rows.append([self._check_and_convert(column, value, encrypt=False)
+                             for column, value in zip(columns, value_row)])
+
+            # 如果有 secure，则这里的类型要么是 BlobType，要么是 NULL
+            cells = [(row, i) for row in rows for i in secure_indexes if isinstance(row[i], BlobType)]
+            start = perf_counter()
+            tokens = self._crypto_executor.encrypt_many(self._fernet, [row[i].data for row, i in cells])
+            if self._instrument is not None:
+                self._instrument.add_time("encrypt", perf_counter() - start)
+            for (row, i), token in zip(cells, tokens):
+                row[i] = BlobType(token)
+            yield from rows
+
     def create_table(self, table_name: str, columns: list[Column],
                      if_not_exists: bool = False, schema_name: str = "",
                      *, execute: bool = True) -> str:
@@ -114,6 +423,7 @@ class Sqlite3Worker(object):
         statement = f"{head} {name} ({columns_str});"
 
         if execute:
+            self._touch_schema(table_name)
             self._execute(statement)
         return statement
 
@@ -129,6 +439,7 @@ class Sqlite3Worker(object):
         statement = f"{head} {name};"
 
         if execute:
+            self._touch_schema(table_name)
             self._execute(statement)
         return statement
 
@@ -136,6 +447,7 @@ class Sqlite3Worker(object):
         head = "ALTER TABLE"
         statement = f"{head} {table_name} RENAME TO {new_name};"
         if execute:
+            self._touch_schema(table_name, new_name)
             self._execute(statement)
         return statement
 
@@ -151,6 +463,7 @@ class Sqlite3Worker(object):
         head = "ALTER TABLE"
         statement = f"{head} {table_name} ADD COLUMN {str(column)};"
         if execute:
+            self._touch_schema(table_name)
             self._execute(statement)
         return statement
 
@@ -162,16 +475,169 @@ class Sqlite3Worker(object):
         head = "ALTER TABLE"
         statement = f"{head} {table_name} RENAME COLUMN {column_name} TO {new_name};"
         if execute:
+            self._touch_schema(table_name)
+            self._execute(statement)
+        return statement
+
+    def operand(self, column: Column | str) -> Operand:
+        """构造使用本对象密钥信息的 Operand，加密时直接复用已经构造好的 fernet"""
+        return Operand(column, fernet=self._fernet)
+
+    def create_index(self, index_name: str, table_name: str, columns: list[Column | str],
+                     unique: bool = False, if_not_exists: bool = False,
+                     where: Expression = None, schema_name: str = "",
+                     *, execute: bool = True) -> str:
+        """columns 中可以是列、order() 的结果或者表达式，where 不为 None 时创建部分索引"""
+        if len(columns) == 0:
+            raise ValueError("Index must have at least one column")
+
+        head = "CREATE UNIQUE INDEX" if unique else "CREATE INDEX"
+        if if_not_exists:
+            head = f"{head} IF NOT EXISTS"
+        name = index_name
+        if len(schema_name) != 0:
+            name = f"{schema_name}.{name}"
+
+        body = f"{head} {name} ON {table_name} ({self._columns_to_string(columns)})"
+        if where is not None:
+            # 索引的条件中不能使用参数，只能写成字面量
+            body = f"{body} WHERE {where}"
+
+        statement = f"{body};"
+        if execute:
+            self._touch_schema()
             self._execute(statement)
         return statement
 
+    def drop_index(self, index_name: str, if_exists: bool = False,
+                   schema_name: str = "", *, execute: bool = True) -> str:
+        head = "DROP INDEX"
+        if if_exists:
+            head = f"{head} IF EXISTS"
+        name = index_name
+        if len(schema_name) != 0:
+            name = f"{schema_name}.{name}"
+
+        statement = f"{head} {name};"
+        if execute:
+            self._touch_schema()
+            self._execute(statement)
+        return statement
+
+    def _explain(self, statement: str, parameters: Sequence) -> list[QueryPlanStep]:
+        cursor = self._conn.cursor()
+        try:
+            self._execute(f"EXPLAIN QUERY PLAN {statement}", parameters, cursor=cursor)
+            return [QueryPlanStep(row[0], row[1], row[3]) for row in cursor]
+        finally:
+            cursor.close()
+
+    def explain(self, table_name: str | Join, columns: list[Column | str], distinct: bool = False,
+                where: Expression = None,
+                order_by: list[str] | str = None,
+                limit: int = None, offset: int = None,
+                *, group_by: list[Column | str] | Column | str = None,
+                having: Expression = None) -> list[QueryPlanStep]:
+        """参数与 select 相同，返回查询计划的每一步"""
+        statement, parameters = self._compile_select(table_name, columns, distinct,
+                                                     where, order_by, limit, offset, group_by, having)
+        return self._explain(statement, parameters)
+
+    def _remember_filter(self, table_name: str | Join, where: Expression | None,
+                         statement: str, parameters: Sequence):
+        # JOIN 中的列带有表名，不用于索引建议
+        if isinstance(table_name, str) and isinstance(where, Expression) and len(where.columns) != 0:
+            self._recent_filters.append((table_name, where.columns, statement, parameters))
+
+    def _indexed_columns(self, table_name: str) -> set[str]:
+        """已有索引的第一列"""
+        return {index.columns[0] for index in self.table_indexes(table_name) if len(index.columns) != 0}
+
+    def advise_indexes(self) -> list[IndexAdvice]:
+        """
+        检查最近执行过的带条件的 select 、update 、delete_from ，
+        如果查询计划是逐行扫描整个表，建议在条件涉及的、还没有索引的列上建立索引。
+        加密的列结果是确定的，同样可以建立索引。
+        """
+        advices = {}
+        checked = set()
+        for table_name, columns, statement, parameters in list(self._recent_filters):
+            if statement in checked:
+                continue
+            checked.add(statement)
+            if not any(step.scans(table_name) for step in self._explain(statement, parameters)):
+                continue
+
+            indexed = self._indexed_columns(table_name)
+            columns = tuple(c for c in columns if c not in indexed)
+            if len(columns) == 0 or (table_name, columns) in advices:
+                continue
+            create = self.create_index(suggest_index_name(table_name, columns), table_name, list(columns),
+                                       if_not_exists=True, execute=False)
+            advices[(table_name, columns)] = IndexAdvice(table_name, columns, create)
+        return list(advices.values())
+
+    def _query_all(self, statement: str, parameters: Sequence = ()) -> list[tuple]:
+        cursor = self._conn.cursor()
+        try:
+            self._execute(statement, parameters, cursor=cursor)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _get_catalog(self) -> SchemaCatalog:
+        # schema_version 在任何连接修改了表结构之后都会变化，读取它不需要解析 sqlite_schema
+        self._catalog.check(self._query_all("PRAGMA schema_version;")[0][0])
+        return self._catalog
+
     def show_tables(self) -> list[str]:
-        cond = Operand("type").equal_to("table").and_(Operand("name").like("sqlite_%", not_=True))
-        _, tables = self.select("sqlite_schema", ["name"], where=cond)
-        return [table[0] for table in tables]
+        catalog = self._get_catalog()
+        if catalog.tables is None:
+            rows = self._query_all("SELECT name FROM sqlite_schema WHERE type = 'table' AND name NOT LIKE 'sqlite_%';")
+            catalog.tables = [row[0] for row in rows]
+        return list(catalog.tables)
+
+    def table_columns(self, table_name: str) -> list[ColumnInfo]:
+        """表中各列的信息，来自 PRAGMA table_info ，表不存在时为空列表"""
+        catalog = self._get_catalog()
+        infos = catalog.columns.get(table_name)
+        if infos is None:
+            rows = self._query_all("SELECT cid, name, type, \"notnull\", dflt_value, pk FROM pragma_table_info(?);",
+                                   [table_name])
+            infos = tuple(ColumnInfo(cid, name, type_, bool(notnull), default, pk)
+                          for cid, name, type_, notnull, default, pk in rows)
+            catalog.columns[table_name] = infos
+        return list(infos)
+
+    def table_indexes(self, table_name: str) -> list[IndexInfo]:
+        """表上的索引，来自 PRAGMA index_list 和 index_info ，包括主键和唯一约束自动创建的索引"""
+        catalog = self._get_catalog()
+        indexes = catalog.indexes.get(table_name)
+        if indexes is None:
+            rows = self._query_all("SELECT name, \"unique\", origin, partial FROM pragma_index_list(?);",
+                                   [table_name])
+            indexes = []
+            for name, unique, origin, partial in rows:
+                columns = self._query_all("SELECT name FROM pragma_index_info(?) ORDER BY seqno;", [name])
+                indexes.append(IndexInfo(name, bool(unique), origin, bool(partial),
+                                         tuple(column[0] for column in columns)))
+            indexes = tuple(indexes)
+            catalog.indexes[table_name] = indexes
+        return list(indexes)
+
+    def reflect_table(self, table_name: str, secure: Iterable[str] = ()) -> Table:
+        """
+        根据数据库中已有的表生成 Table 的实例，数据库中没有记录哪些列是加密的，需要在 secure 中给出。
+        只有单列的主键和唯一约束能够还原，表达式形式的默认值会被忽略
+        """
+        infos = self.table_columns(table_name)
+        if len(infos) == 0:
+            raise ValueError(f"Table not found: {table_name}")
+        columns = reflect_columns(tuple(infos), tuple(self.table_indexes(table_name)), set(secure))
+        return make_table(table_name, columns)
 
     @staticmethod
-    def _columns_to_string(columns: list[Column | str]) -> str:
+    def _column_names(columns: list[Column | str]) -> tuple[str, ...]:
         columns_str_ls = []
         for column in columns:
             if isinstance(column, Column):
@@ -180,46 +646,140 @@ class Sqlite3Worker(object):
                 columns_str_ls.append(column)
             else:
                 raise ValueError(f"Column must be str or Column object, found {type(column)}")
-        return ", ".join(columns_str_ls)
+        return tuple(columns_str_ls)
+
+    @classmethod
+    def _columns_to_string(cls, columns: list[Column | str]) -> str:
+        return ", ".join(cls._column_names(columns))
+
+    @staticmethod
+    def _where_parts(where: Expression | None) -> tuple[str | None, list]:
+        if where is None:
+            return None, []
+        if isinstance(where, Expression):
+            return where.sql, where.params
+        return str(where), []
 
     def insert_into(self, table_name: str, columns: list[Column | str],
                     values: list[list[GeneralValueTypes]],
                     *, execute: bool = True, commit: bool = True) -> str:
-        col_count = len(columns)
+        rows = self._convert_rows(columns, values)
+        if self._instrument is None:
+            statement = self._insert_statement(table_name, columns, rows)
+        else:
+            # 先完成检查和加密，只把拼接字面量的时间计入 build
+            rows = list(rows)
+            start = perf_counter()
+            statement = self._insert_statement(table_name, columns, rows)
+            self._instrument.add_time("build", perf_counter() - start)
+        if execute:
+            self._touch(table_name)
+            self._execute(statement)
+            self._commit_if(commit)
+        return statement
+
+    def _insert_statement(self, table_name: str, columns: list[Column | str], rows: Iterable[list]) -> str:
         columns_str = self._columns_to_string(columns)
 
         values_str_ls = []
-        for value_row in values:
-            if len(value_row) != col_count:
-                raise ValueError(f"Length of values must be {col_count}")
+        for value_row in rows:
+            value_row_str_ls = [to_string(value) for value in value_row]
+            values_str_ls.append(f"({', '.join(value_row_str_ls)})")
 
-            value_row_str_ls = []
-            for column, value in zip(columns, value_row):
-                if isinstance(column, Column):
-                    if not self._check_data_type(column.data_type, column.nullable, value):
-                        raise ValueError(f"Type of {column.name} must be {column.data_type}, found {type(value)}")
-                    value = self._try_encrypt(column, implicitly_convert(column.data_type, value))
+        values_str = ", ".join(values_str_ls)
 
-                value_row_str_ls.append(to_string(value))
+        head = "INSERT INTO"
+        return f"{head} {table_name} ({columns_str}) VALUES {values_str};"
 
-            values_str_ls.append(f"({', '.join(value_row_str_ls)})")
+    def _iter_params(self, columns: list[Column | str],
+                     values: Iterable[Sequence[GeneralValueTypes]]) -> Iterator[tuple]:
+        for value_row in self._convert_rows(columns, values):
+            yield tuple(to_param(value) for value in value_row)
 
-        values_str = ", ".join(values_str_ls)
+    def insert_many(self, table_name: str, columns: list[Column | str],
+                    values: Iterable[Sequence[GeneralValueTypes]],
+                    *, execute: bool = True, commit: bool = True) -> str:
+        # 与 insert_into 相同的类型检查和加密，但使用 ? 占位符和 executemany，
+        # values 可以是任意可迭代对象（包括生成器），逐行消费，不会一次性生成整条语句
+        columns_str = self._columns_to_string(columns)
+        placeholders = ", ".join(["?"] * len(columns))
 
         head = "INSERT INTO"
-        statement = f"{head} {table_name} ({columns_str}) VALUES {values_str};"
+        statement = f"{head} {table_name} ({columns_str}) VALUES ({placeholders});"
         if execute:
-            self._execute(statement)
-            if commit:
-                self._conn.commit()
+            self._touch(table_name)
+            self._executemany(statement, self._iter_params(columns, values))
+            self._commit_if(commit)
+        return statement
+
+    def upsert(self, table_name: str, columns: list[Column | str],
+               values: Iterable[Sequence[GeneralValueTypes]],
+               conflict_columns: list[Column | str],
+               update_columns: list[Column | str] = None,
+               *, execute: bool = True, commit: bool = True) -> str:
+        """
+        插入数据，与 conflict_columns 上的唯一约束冲突时改为更新 update_columns，
+        update_columns 为 None 时更新除 conflict_columns 以外的所有列，为空列表时忽略冲突的行
+        """
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise ValueError("SQLite under 3.24.0 does not support upsert")
+        if len(conflict_columns) == 0:
+            raise ValueError("conflict_columns must not be empty")
+
+        conflict_names = self._column_names(conflict_columns)
+        if update_columns is None:
+            update_names = tuple(name for name in self._column_names(columns) if name not in conflict_names)
+        else:
+            update_names = self._column_names(update_columns)
+
+        head = "INSERT INTO"
+        placeholders = ", ".join(["?"] * len(columns))
+        body = (f"{head} {table_name} ({self._columns_to_string(columns)}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({', '.join(conflict_names)})")
+        if len(update_names) == 0:
+            body = f"{body} DO NOTHING"
+        else:
+            body = f"{body} DO UPDATE SET {', '.join([f'{name} = excluded.{name}' for name in update_names])}"
+
+        statement = f"{body};"
+        if execute:
+            self._touch(table_name)
+            self._executemany(statement, self._iter_params(columns, values))
+            self._commit_if(commit)
+        return statement
+
+    def bulk_update(self, table_name: str, key_column: Column | str, columns: list[Column | str],
+                    values: Iterable[Sequence[GeneralValueTypes]],
+                    *, execute: bool = True, commit: bool = True) -> str:
+        """
+        按 key_column 批量更新，values 的每一行是 [key, *新的值]，与 [key_column, *columns] 对应，
+        所有行在一条带占位符的语句中通过 executemany 执行
+        """
+        if len(columns) == 0:
+            raise ValueError("columns must not be empty")
+
+        key_name = self._column_names([key_column])[0]
+        set_str = ", ".join([f"{name} = ?" for name in self._column_names(columns)])
+        statement = f"UPDATE {table_name} SET {set_str} WHERE {key_name} = ?;"
+        if execute:
+            self._touch(table_name)
+            # 键在最前面传入，但在语句中是最后一个参数
+            params = (row[1:] + row[:1] for row in self._iter_params([key_column, *columns], values))
+            self._executemany(statement, params)
+            self._commit_if(commit)
         return statement
 
     @staticmethod
     def _join_where_order_limit(body: str,
                                 where: Expression, order_by: list[str] | str,
-                                limit: int, offset: int) -> str:
+                                limit: int, offset: int,
+                                group_by: list[str] = None, having: Expression = None) -> str:
         if where is not None:
             body = f"{body} WHERE {where}"
+        if group_by is not None:
+            body = f"{body} GROUP BY {', '.join(group_by)}"
+            if having is not None:
+                body = f"{body} HAVING {having}"
         if order_by is not None:
             if not isinstance(order_by, list):
                 order_by = [order_by]
@@ -230,11 +790,10 @@ class Sqlite3Worker(object):
                 body = f"{body} OFFSET {offset}"
         return body
 
-    def select(self, table_name: str, columns: list[Column | str], distinct: bool = False,
-               where: Expression = None,
-               order_by: list[str] | str = None,
-               limit: int = None, offset: int = None,
-               *, execute: bool = True) -> tuple[str, list[list]]:
+    def _select_statement(self, table_name: str | Join, columns: list[Column | str], distinct: bool,
+                          where: Expression, order_by: list[str] | str,
+                          limit: int, offset: int,
+                          group_by: list[Column | str] | Column | str = None, having: Expression = None) -> str:
         if len(columns) == 0:
             columns_str = "*"
         else:
@@ -244,70 +803,560 @@ class Sqlite3Worker(object):
         if distinct:
             head = f"{head} DISTINCT"
         body = f"{head} {columns_str} FROM {table_name}"
-        body = self._join_where_order_limit(body, where, order_by, limit, offset)
+        if group_by is not None:
+            group_by = list(self._column_names(group_by if isinstance(group_by, list) else [group_by]))
+        body = self._join_where_order_limit(body, where, order_by, limit, offset, group_by, having)
 
-        statement = f"{body};"
-        if execute:
-            self._execute(statement)
-            rows = self._cursor.fetchall()
-            rows = [list(row) for row in rows]  # 将每行转成列表，方便替换解密数据
-            # 下面的整个循环都是为了找到需要解密的数据尝试解密
-            for i in range(len(columns)):
-                column = columns[i]
-                if isinstance(column, Column) and column.secure:
-                    for row in rows:
-                        # 如果是加密的 BLOB 但是值不为 NULL 才解密
-                        if row[i] is not None and self._fernet is not None:
-                            # 不管是key错误还是密文错误，都是 InvalidToken，貌似没法区分
-                            # 因此如果有的数据不是加密过的，应该跳过，不应该影响之后的密文解密，
-                            # 因此这里还是得继续循环下去
-                            try:
-                                row[i] = self._fernet.decrypt(row[i])
-                            except (InvalidToken, AttributeError):
-                                pass
+        return f"{body};"
+
+    def _compile_select(self, table_name: str | Join, columns: list[Column | str], distinct: bool,
+                        where: Expression, order_by: list[str] | str,
+                        limit: int, offset: int,
+                        group_by: list[Column | str] | Column | str = None,
+                        having: Expression = None) -> tuple[str, list]:
+        # 同一结构的查询只生成一次语句，之后只需要绑定参数
+        # JOIN 的 ON 条件中的参数在最前面
+        if isinstance(table_name, Join):
+            table_name, parameters = table_name.sql, table_name.params
+        else:
+            parameters = []
+        where_sql, where_params = self._where_parts(where)
+        parameters.extend(where_params)
+        if order_by is not None and not isinstance(order_by, list):
+            order_by = [order_by]
+        if group_by is not None:
+            group_by = self._column_names(group_by if isinstance(group_by, list) else [group_by])
+        elif having is not None:
+            raise ValueError("having requires group_by")
+        # HAVING 的参数在 WHERE 之后，LIMIT 之前
+        having_sql, having_params = self._where_parts(having)
+        parameters.extend(having_params)
+        has_limit = limit is not None
+        has_offset = has_limit and offset is not None
+        key = ("SELECT", table_name, self._column_names(columns), distinct, where_sql,
+               None if order_by is None else tuple(order_by), has_limit, has_offset, group_by, having_sql)
+        statement = self._build_statement(key, lambda: self._select_statement(
+            table_name, columns, distinct, where_sql, order_by,
+            "?" if has_limit else None, "?" if has_offset else None,
+            None if group_by is None else list(group_by), having_sql,
+        ))
+
+        if has_limit:
+            parameters.append(limit)
+        if has_offset:
+            parameters.append(offset)
+        return statement, parameters
+
+    @staticmethod
+    def _secure_indexes(columns: list[Column | str]) -> list[int]:
+        return [i for i, column in enumerate(columns) if isinstance(column, Column) and column.secure]
+
+    def _decrypt_row(self, secure_indexes: list[int], row: tuple, error: type[Exception]) -> list:
+        row = list(row)  # 将每行转成列表，方便替换解密数据
+        for i in secure_indexes:
+            # 如果是加密的 BLOB 但是值不为 NULL 才解密
+            if row[i] is not None:
+                # 不管是key错误还是密文错误，都是 InvalidToken，貌似没法区分
+                # 因此如果有的数据不是加密过的，应该跳过，不应该影响之后的密文解密，
+                # 因此这里还是得继续循环下去
+                try:
+                    row[i] = self._fernet.decrypt(row[i])
+                except (error, AttributeError):
+                    pass
+        return row
+
+    def _decrypt_rows(self, secure_indexes: list[int], rows: Iterable[tuple],
+                      make: Callable[[Sequence], Any] = list) -> list:
+        # 没有需要解密的列时不复制成列表，直接交给 make
+        if self._fernet is None or len(secure_indexes) == 0:
+            return [make(row) for row in rows]
+        if self._crypto_executor is None:
+            # 异常类型每次调用只取一次，只在开启统计时计时
+            error = invalid_token()
+            if self._instrument is None:
+                return self._decrypt_each(secure_indexes, rows, make, error)
+            start = perf_counter()
+            result = self._decrypt_each(secure_indexes, rows, make, error)
+            self._instrument.add_time("decrypt", perf_counter() - start)
+            return result
+
+        # 把所有需要解密的值收集起来一起交给 crypto_executor
+        rows = [list(row) for row in rows]
+        cells = [(row, i) for row in rows for i in secure_indexes if row[i] is not None]
+        start = perf_counter()
+        plains = self._crypto_executor.decrypt_many(self._fernet, [row[i] for row, i in cells])
+        if self._instrument is not None:
+            self._instrument.add_time("decrypt", perf_counter() - start)
+        for (row, i), plain in zip(cells, plains):
+            row[i] = plain
+        if make is list:
+            return rows
+        return [make(row) for row in rows]
+
+    def _decrypt_each(self, secure_indexes: list[int], rows: Iterable[tuple],
+                      make: Callable[[Sequence], Any], error: type[Exception]) -> list:
+        # _decrypt_row 已经得到了列表，make 为 list 时不需要再复制一遍
+        if make is list:
+            return [self._decrypt_row(secure_indexes, row, error) for row in rows]
+        return [make(self._decrypt_row(secure_indexes, row, error)) for row in rows]
+
+    def _row_factory(self, row_type: RowType, columns: list[Column | str],
+                     cursor: sqlite3.Cursor = None) -> Callable[[Sequence], Any]:
+        if row_type == "list":
+            return list
+        if len(columns) == 0 and cursor is not None:
+            # SELECT * 的时候列名从游标中取
+            return row_factory(row_type, [d[0] for d in cursor.description])
+        return row_factory(row_type, [output_name(name) for name in self._column_names(columns)])
 
+    def select(self, table_name: str | Join, columns: list[Column | str], distinct: bool = False,
+               where: Expression = None,
+               order_by: list[str] | str = None,
+               limit: int = None, offset: int = None,
+               *, execute: bool = True, row_type: RowType = "list",
+               cache: bool = True,
+               group_by: list[Column | str] | Column | str = None,
+               having: Expression = None) -> tuple[str, list]:
+        # 不执行的时候返回完整的语句，执行的时候返回实际执行的带占位符的语句
+        if execute:
+            statement, parameters = self._compile_select(table_name, columns, distinct,
+                                                         where, order_by, limit, offset, group_by, having)
+            result_cache = self._result_cache if cache else None
+            if result_cache is not None:
+                # Table 实例不可哈希，结果的形式只与它的类有关
+                type_key = row_type if isinstance(row_type, (str, type)) else type(row_type)
+                cache_key = (statement, tuple(parameters), type_key)
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    return statement, cached.copy()
+                generation = result_cache.generation
+            self._execute(statement, parameters)
+            self._remember_filter(table_name, where, statement, parameters)
+            start = perf_counter()
+            secure_indexes = self._secure_indexes(columns)
+            make = self._row_factory(row_type, columns, self._cursor)
+            if result_cache is None:
+                # 直接迭代游标，不先 fetchall 再复制一遍
+                rows = self._decrypt_rows(secure_indexes, self._cursor, make)
+            else:
+                # 缓存中保存元组，调用者拿到的行是另外生成的，修改它们不会影响缓存
+                cached = CachedRows(self._decrypt_rows(secure_indexes, self._cursor, tuple), make)
+                rows = cached.copy()
+            if self._instrument is not None:
+                self._instrument.add_rows(statement, len(rows), perf_counter() - start)
+            if result_cache is not None:
+                tables = table_name.tables if isinstance(table_name, Join) else (table_name,)
+                # 事务中写过的表，查到的结果包含还没提交的修改，不能放进其他连接也在用的缓存
+                if not (self._conn.in_transaction and self._dirty_tables.intersection(tables)):
+                    result_cache.put(cache_key, tables, cached, generation)
             return statement, rows
         else:
+            if having is not None and group_by is None:
+                raise ValueError("having requires group_by")
+            statement = self._select_statement(table_name, columns, distinct, where, order_by, limit, offset,
+                                               group_by, having)
             return statement, []
 
+    def count(self, table_name: str | Join, where: Expression = None) -> int:
+        """满足条件的行数，由 SQLite 计算，只返回一个数"""
+        _, rows = self.select(table_name, [Aggregate.count()], where=where)
+        return rows[0][0]
+
+    def exists(self, table_name: str | Join, where: Expression = None) -> bool:
+        """是否存在满足条件的行，找到第一行就停止"""
+        _, rows = self.select(table_name, ["1"], where=where, limit=1)
+        return len(rows) != 0
+
+    def iter_select(self, table_name: str | Join, columns: list[Column | str], distinct: bool = False,
+                    where: Expression = None,
+                    order_by: list[str] | str = None,
+                    limit: int = None, offset: int = None,
+                    *, chunk_size: int = 1000, row_type: RowType = "list",
+                    group_by: list[Column | str] | Column | str = None,
+                    having: Expression = None) -> Iterator:
+        """与 select 相同，但是逐行产出结果，每次从数据库 fetchmany 取 chunk_size 行，内存占用恒定"""
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        statement, parameters = self._compile_select(table_name, columns, distinct,
+                                                     where, order_by, limit, offset, group_by, having)
+        secure_indexes = self._secure_indexes(columns)
+        # 使用单独的游标，这样迭代过程中仍然可以调用其他方法
+        cursor = self._conn.cursor()
+        try:
+            self._execute(statement, parameters, cursor=cursor)
+            self._remember_filter(table_name, where, statement, parameters)
+            make = self._row_factory(row_type, columns, cursor)
+            while True:
+                start = perf_counter()
+                chunk = cursor.fetchmany(chunk_size)
+                if len(chunk) == 0:
+                    break
+                rows = self._decrypt_rows(secure_indexes, chunk, make)
+                if self._instrument is not None:
+                    self._instrument.add_rows(statement, len(rows), perf_counter() - start)
+                yield from rows
+        finally:
+            cursor.close()
+
+    def select_columns(self, table_name: str, columns: list[Column | str],
+                       where: Expression = None,
+                       order_by: list[str] | str = None,
+                       limit: int = None, offset: int = None,
+                       *, chunk_size: int = 10000, use_numpy: bool = None) -> dict[str, ColumnArray]:
+        """
+        按列返回查询结果，INTEGER 和 REAL 列按块写入 array.array ，
+        安装了 numpy 时（或 use_numpy 为 True）转换为 numpy 数组，其他类型的列为列表。
+        可以为 NULL 的列同时返回 NULL 的掩码。
+        """
+        if len(columns) == 0:
+            raise ValueError("columns must not be empty")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        numpy = None
+        if use_numpy is not False:
+            numpy = load_numpy()
+            if numpy is None and use_numpy:
+                raise ModuleNotFoundError("numpy is not installed")
+
+        buffers = [ColumnBuffer(column) for column in columns]
+        secure_indexes = self._secure_indexes(columns)
+        for chunk in self._chunks_of_select(table_name, columns, where, order_by, limit, offset, chunk_size):
+            if len(secure_indexes) != 0:
+                chunk = self._decrypt_rows(secure_indexes, chunk)
+            for buffer, values in zip(buffers, zip(*chunk)):
+                buffer.extend(values)
+
+        names = self._column_names(columns)
+        return {name: buffer.finish(numpy) for name, buffer in zip(names, buffers)}
+
+    def _chunks_of_select(self, table_name: str, columns: list[Column | str],
+                          where: Expression, order_by: list[str] | str,
+                          limit: int, offset: int, chunk_size: int) -> Iterator[list[tuple]]:
+        statement, parameters = self._compile_select(table_name, columns, False, where, order_by, limit, offset)
+        cursor = self._conn.cursor()
+        try:
+            self._execute(statement, parameters, cursor=cursor)
+            self._remember_filter(table_name, where, statement, parameters)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if len(chunk) == 0:
+                    break
+                yield chunk
+        finally:
+            cursor.close()
+
+    def insert_columns(self, table_name: str, columns: list[Column | str],
+                       arrays: list[Sequence], masks: list[Sequence[bool] | None] = None,
+                       *, chunk_size: int = 10000, commit: bool = True) -> str:
+        """
+        insert_many 的按列版本，arrays 可以是列表、array.array 或 numpy 数组，
+        masks 中为 True 的位置插入 NULL ，数据按块转换为行，不会一次性复制全部数据
+        """
+        if len(columns) == 0:
+            raise ValueError("columns must not be empty")
+        if len(arrays) != len(columns):
+            raise ValueError(f"Length of arrays must be {len(columns)}")
+        if masks is None:
+            masks = [None] * len(columns)
+        elif len(masks) != len(columns):
+            raise ValueError(f"Length of masks must be {len(columns)}")
+
+        return self.insert_many(table_name, columns, iter_column_rows(arrays, masks, chunk_size), commit=commit)
+
+    @staticmethod
+    def _blob_column(column: Column | str) -> str:
+        check_blobopen()
+        if isinstance(column, Column):
+            if column.secure:
+                raise ValueError(f"Secure column {column.name} can not be streamed")
+            if column.data_type != DataType.BLOB:
+                raise ValueError(f"Type of {column.name} must be {DataType.BLOB}, found {column.data_type}")
+            return column.name
+        return column
+
+    def open_blob(self, table_name: str, column: Column | str, rowid: int,
+                  *, readonly: bool = True, schema_name: str = "main") -> sqlite3.Blob:
+        """
+        打开一个 BLOB 的读写句柄，可以 read 、write 、seek ，不能改变 BLOB 的长度。
+        加密的列不能流式读写
+        """
+        name = self._blob_column(column)
+        if not readonly:
+            self._touch(table_name)
+        return self._conn.blobopen(table_name, name, rowid, readonly=readonly, name=schema_name)
+
+    def insert_blob(self, table_name: str, column: Column | str, source: BinaryPathOrFile,
+                    columns: list[Column | str] = (), values: Sequence[GeneralValueTypes] = (),
+                    *, size: int = None, chunk_size: int = 1 << 20) -> int:
+        """
+        插入一行，column 先以 zeroblob 占位，再从 source 每次读取 chunk_size 字节写入，返回该行的 rowid 。
+        source 是路径或二进制文件对象，size 为 None 时取文件剩余的长度，管道、套接字等需要指定 size 。
+        columns 和 values 是这一行其他列的值。插入和写入在同一个事务中完成
+        """
+        name = self._blob_column(column)
+        if len(columns) != len(values):
+            raise ValueError(f"Length of values must be {len(columns)}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        params = list(next(self._iter_params(list(columns), [values])))
+        names = ", ".join([*self._column_names(columns), name])
+        placeholders = ", ".join(["?"] * len(columns) + ["zeroblob(?)"])
+        statement = f"INSERT INTO {table_name} ({names}) VALUES ({placeholders});"
+        with open_file(source, "rb") as f:
+            if size is None:
+                size = remaining_size(f)
+                if size is None:
+                    raise ValueError("size must be given if it can not be determined from source")
+            with self.transaction():
+                self._touch(table_name)
+                self._execute(statement, [*params, size])
+                rowid = self._cursor.lastrowid
+                with self._conn.blobopen(table_name, name, rowid, readonly=False) as blob:
+                    written = copy_stream(f, blob, size, chunk_size)
+                if written != size:
+                    raise ValueError(f"Expected {size} bytes from source, got {written}")
+        return rowid
+
+    def read_blob(self, table_name: str, column: Column | str, rowid: int, target: BinaryPathOrFile,
+                  *, chunk_size: int = 1 << 20) -> int:
+        """把一个 BLOB 每次 chunk_size 字节写入 target（路径或二进制文件对象），返回写入的字节数"""
+        name = self._blob_column(column)
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        with self._conn.blobopen(table_name, name, rowid, readonly=True) as blob, open_file(target, "wb") as f:
+            return copy_stream(blob, f, None, chunk_size)
+
+    def _import_rows(self, table_name: str, columns: list[Column | str], rows: Iterator[list],
+                     batch_size: int, progress: Callable[[TransferReport], Any] | None) -> TransferReport:
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        # _transfer 会导入 csv 和 json ，导入导出时才导入
+        from ._transfer import ProgressTimer
+        timer = ProgressTimer()
+
+        def insert_batches():
+            for chunk in batched(rows, batch_size):
+                self.insert_many(table_name, columns, chunk)
+                timer.rows += len(chunk)
+                if progress is not None:
+                    progress(timer.report())
+
+        # 每一批在自己的事务中提交；已经在事务中时不单独提交，由外面的事务决定
+        if self.in_transaction:
+            insert_batches()
+        else:
+            with self.batch(1):
+                insert_batches()
+        return timer.report()
+
+    def import_csv(self, path_or_file: PathOrFile, table_name: str, columns: list[Column | str],
+                   *, header: bool = True, delimiter: str = ",", encoding: str = "utf8",
+                   batch_size: int = 10000,
+                   progress: Callable[[TransferReport], Any] = None) -> TransferReport:
+        """
+        流式导入 CSV ，按 columns 的类型转换每个值（BLOB 为十六进制），加密的列会加密，
+        每 batch_size 行在一个事务中插入并提交一次，每批之后调用 progress(report)。
+        header 为 True 时按表头中的列名对应，否则按顺序对应。
+        """
+        from ._transfer import read_csv_rows
+        names = self._column_names(columns)
+        with open_file(path_or_file, "r", encoding) as f:
+            rows = read_csv_rows(f, columns, names, header, delimiter)
+            return self._import_rows(table_name, columns, rows, batch_size, progress)
+
+    def import_jsonl(self, path_or_file: PathOrFile, table_name: str, columns: list[Column | str],
+                     *, encoding: str = "utf8", batch_size: int = 10000,
+                     progress: Callable[[TransferReport], Any] = None) -> TransferReport:
+        """与 import_csv 相同，每行是一个以列名为键的 JSON 对象，缺少的键视为 NULL"""
+        from ._transfer import read_jsonl_rows
+        names = self._column_names(columns)
+        with open_file(path_or_file, "r", encoding) as f:
+            rows = read_jsonl_rows(f, columns, names)
+            return self._import_rows(table_name, columns, rows, batch_size, progress)
+
+    def export_csv(self, path_or_file: PathOrFile, table_name: str, columns: list[Column | str],
+                   where: Expression = None, order_by: list[str] | str = None,
+                   *, header: bool = True, delimiter: str = ",", encoding: str = "utf8",
+                   chunk_size: int = 10000,
+                   progress: Callable[[TransferReport], Any] = None) -> TransferReport:
+        """流式导出为 CSV ，加密的列会解密，BLOB 写为十六进制，NULL 写为空字符串"""
+        import csv
+        from ._transfer import ProgressTimer, format_csv_row
+        names = self._column_names(columns)
+        timer = ProgressTimer()
+        with open_file(path_or_file, "w", encoding) as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            if header:
+                writer.writerow(names)
+            rows = self.iter_select(table_name, columns, where=where, order_by=order_by,
+                                    chunk_size=chunk_size, row_type="tuple")
+            for chunk in batched(rows, chunk_size):
+                writer.writerows([format_csv_row(row) for row in chunk])
+                timer.rows += len(chunk)
+                if progress is not None:
+                    progress(timer.report())
+        return timer.report()
+
+    def export_jsonl(self, path_or_file: PathOrFile, table_name: str, columns: list[Column | str],
+                     where: Expression = None, order_by: list[str] | str = None,
+                     *, encoding: str = "utf8", chunk_size: int = 10000,
+                     progress: Callable[[TransferReport], Any] = None) -> TransferReport:
+        """流式导出为 JSON Lines ，每行是一个以列名为键的对象，BLOB 写为十六进制"""
+        from ._transfer import ProgressTimer, format_jsonl_row
+        names = self._column_names(columns)
+        timer = ProgressTimer()
+        with open_file(path_or_file, "w", encoding) as f:
+            rows = self.iter_select(table_name, columns, where=where, order_by=order_by,
+                                    chunk_size=chunk_size, row_type="tuple")
+            for chunk in batched(rows, chunk_size):
+                f.writelines([format_jsonl_row(names, row) for row in chunk])
+                timer.rows += len(chunk)
+                if progress is not None:
+                    progress(timer.report())
+        return timer.report()
+
+    @staticmethod
+    def _parse_order(term: Column | str) -> tuple[str, bool]:
+        """从 order() 的结果中取出列名和是否降序"""
+        if isinstance(term, Column):
+            return term.name, False
+        words = term.split()
+        return words[0], len(words) > 1 and words[1].upper() == "DESC"
+
+    @staticmethod
+    def _seek_expression(keys: list[tuple[str, bool]], last: list) -> Expression:
+        descs = {desc for _, desc in keys}
+        if len(descs) == 1:
+            op = "<" if keys[0][1] else ">"
+            if len(keys) == 1:
+                return Expression(f"{keys[0][0]} {op} ?", last)
+            if sqlite3.sqlite_version_info >= (3, 15, 0):
+                names = ", ".join([name for name, _ in keys])
+                placeholders = ", ".join(["?"] * len(keys))
+                return Expression(f"({names}) {op} ({placeholders})", last)
+
+        # 排序方向不一致（或者不支持行值比较）时展开为
+        # (k1 > ?) OR (k1 = ? AND k2 < ?) OR ...
+        ors = []
+        params = []
+        for i, (name, desc) in enumerate(keys):
+            terms = [f"{prev} = ?" for prev, _ in keys[:i]]
+            terms.append(f"{name} {'<' if desc else '>'} ?")
+            ors.append(f"({' AND '.join(terms)})")
+            params.extend(last[:i + 1])
+        return Expression(f"({' OR '.join(ors)})", params)
+
+    def paginate(self, table_name: str, columns: list[Column | str],
+                 order_by: list[Column | str] | Column | str,
+                 page_size: int = 1000, where: Expression = None,
+                 *, row_type: RowType = "list") -> Iterator[list]:
+        """
+        按 order_by 分页，每次产出一页。不使用 OFFSET ，而是记住上一页最后一行的排序键，
+        下一页从它之后开始查询，翻到多深都不需要跳过前面的行。
+        order_by 可以是列或者 order() 的结果，支持降序和多列，排序键应当唯一且不为 NULL 。
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+        if len(columns) == 0:
+            raise ValueError("columns must not be empty")
+        if not isinstance(order_by, list):
+            order_by = [order_by]
+        if len(order_by) == 0:
+            raise ValueError("order_by must not be empty")
+
+        keys = [self._parse_order(term) for term in order_by]
+        order_by = [term.name if isinstance(term, Column) else term for term in order_by]
+
+        # 排序键不在查询的列中时额外查出来，产出前再去掉
+        names = list(self._column_names(columns))
+        query_columns = list(columns)
+        key_indexes = []
+        for name, _ in keys:
+            if name not in names:
+                names.append(name)
+                query_columns.append(name)
+            key_indexes.append(names.index(name))
+        col_count = len(columns)
+        secure_indexes = self._secure_indexes(columns)
+        make = self._row_factory(row_type, columns)
+
+        last = None
+        while True:
+            cond = where
+            if last is not None:
+                seek = self._seek_expression(keys, last)
+                # 原来的条件中可能有 OR ，要加上括号
+                cond = seek if where is None else where._wrap("(", ")").and_(seek)
+            statement, parameters = self._compile_select(table_name, query_columns, False,
+                                                         cond, order_by, page_size, None)
+            self._execute(statement, parameters)
+            raw_rows = self._cursor.fetchall()
+            if len(raw_rows) == 0:
+                return
+
+            # 用解密前的值作为下一页的起点，与数据库中的排序一致
+            last = [raw_rows[-1][i] for i in key_indexes]
+            page_len = len(raw_rows)
+            if len(query_columns) != col_count:
+                raw_rows = [row[:col_count] for row in raw_rows]
+            yield self._decrypt_rows(secure_indexes, raw_rows, make)
+            if page_len < page_size:
+                return
+
     def delete_from(self, table_name: str, where: Expression = None,
                     *, execute: bool = True, commit: bool = True) -> str:
-        head = "DELETE FROM"
-        body = f"{head} {table_name}"
-        if where is not None:
-            body = f"{body} WHERE {where}"
+        if not execute:
+            head = "DELETE FROM"
+            body = f"{head} {table_name}"
+            if where is not None:
+                body = f"{body} WHERE {where}"
+            return f"{body};"
 
-        statement = f"{body};"
-        if execute:
-            self._execute(statement)
-            if commit:
-                self._conn.commit()
+        where_sql, parameters = self._where_parts(where)
+
+        def build() -> str:
+            body_ = f"DELETE FROM {table_name}"
+            if where_sql is not None:
+                body_ = f"{body_} WHERE {where_sql}"
+            return f"{body_};"
+
+        statement = self._build_statement(("DELETE", table_name, where_sql), build)
+        self._touch(table_name)
+        self._execute(statement, parameters)
+        self._remember_filter(table_name, where, statement, parameters)
+        self._commit_if(commit)
         return statement
 
     def update(self, table_name: str, new_values: list[tuple[Column | str, GeneralValueTypes]],
                where: Expression = None,
                *, execute: bool = True, commit: bool = True) -> str:
-        new_values_str_ls = []
+        names = []
+        values = []
         for column, value in new_values:
-            if isinstance(column, Column):
-                if not self._check_data_type(column.data_type, column.nullable, value):
-                    raise ValueError(f"Type of {column.name} must be {column.data_type}, found {type(value)}")
-                value = self._try_encrypt(column, implicitly_convert(column.data_type, value))
+            values.append(self._check_and_convert(column, value))
+            names.append(column.name if isinstance(column, Column) else column)
 
-                name = column.name
-            else:
-                name = column
+        if not execute:
+            new_values_str = ", ".join([f"{name} = {to_string(value)}" for name, value in zip(names, values)])
+            body = f"UPDATE {table_name} SET {new_values_str}"
+            if where is not None:
+                body = f"{body} WHERE {where}"
+            return f"{body};"
 
-            new_values_str_ls.append(f"{name} = {to_string(value)}")
+        where_sql, parameters = self._where_parts(where)
 
-        head = f"UPDATE {table_name}"
-        body = f"{head} SET {', '.join(new_values_str_ls)}"
-        if where is not None:
-            body = f"{body} WHERE {where}"
+        def build() -> str:
+            body_ = f"UPDATE {table_name} SET {', '.join([f'{name} = ?' for name in names])}"
+            if where_sql is not None:
+                body_ = f"{body_} WHERE {where_sql}"
+            return f"{body_};"
 
-        statement = f"{body};"
-        if execute:
-            self._execute(statement)
-            if commit:
-                self._conn.commit()
+        statement = self._build_statement(("UPDATE", table_name, tuple(names), where_sql), build)
+        parameters = [to_param(value) for value in values] + parameters
+        self._touch(table_name)
+        self._execute(statement, parameters)
+        self._remember_filter(table_name, where, statement, parameters)
+        self._commit_if(commit)
         return statement
@@ -0,0 +1,98 @@
+# coding: utf8
+"""
+import Sqlite3Helper 的耗时测试，每次在新的解释器中导入，结果以 JSON 输出。
+
+    python benchmarks/bench_import.py --repeat 20 --max-ms 80
+    python benchmarks/bench_import.py --compare ../Sqlite3Helper-2.3.0
+
+baseline_ms 是启动一个空解释器的时间，import_total_ms 是启动并导入的时间，import_ms 是两者之差。
+--compare 指定另一份源码（比如旧版本的 git worktree），同样测出它的 import_ms 放在 compare_import_ms 中。
+指定 --max-ms 时，import_ms 超过该值或者导入时加载了不应加载的模块
+（logging 、threading 、concurrent.futures 、csv 、json 、cryptography 、asyncio 、multiprocessing 、numpy）
+会以非 0 状态退出，可以放在 CI 中。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 这些模块只在用到对应功能时才导入
+LAZY_MODULES = ["logging", "threading", "concurrent.futures", "csv", "json",
+                "cryptography", "asyncio", "multiprocessing", "numpy"]
+
+# 环境中设置了 PYTHONDONTWRITEBYTECODE 时每次都要重新编译，测出来的主要是编译时间
+ENV = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+
+# 先导入 Sqlite3Helper 再检查，最后才导入 json 输出结果
+CHECK_CODE = (
+    "import sys, Sqlite3Helper; "
+    f"loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]; "
+    "import json; print(json.dumps(loaded))"
+)
+
+
+def run_once(code: str, cwd: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=cwd, env=ENV)
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(code: str, repeat: int, cwd: str = ROOT) -> float:
+    run_once(code, cwd)  # 预热，生成 .pyc
+    return statistics.median(run_once(code, cwd) for _ in range(repeat))
+
+
+def loaded_lazy_modules() -> list[str]:
+    output = subprocess.run([sys.executable, "-c", CHECK_CODE], check=True, cwd=ROOT, env=ENV,
+                            capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="number of fresh interpreters for each measurement")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if median import time exceeds this")
+    parser.add_argument("--compare", default="", help="another source tree to measure the same way")
+    parser.add_argument("--output", default="", help="write JSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    baseline = measure("pass", args.repeat)
+    imported = measure("import Sqlite3Helper", args.repeat)
+    import_ms = imported - baseline
+    lazy_loaded = loaded_lazy_modules()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "baseline_ms": round(baseline, 3),
+        "import_total_ms": round(imported, 3),
+        "import_ms": round(import_ms, 3),
+        "lazy_modules_loaded": lazy_loaded,
+    }
+    if args.compare:
+        compare_ms = measure("import Sqlite3Helper", args.repeat, os.path.abspath(args.compare)) - baseline
+        report["compare_import_ms"] = round(compare_ms, 3)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    # 不指定 --max-ms 时只输出结果，不做检查
+    if args.max_ms is not None and (import_ms > args.max_ms or len(lazy_loaded) != 0):
+        print(f"import check failed: {import_ms:.1f} ms, eagerly loaded: {lazy_loaded}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
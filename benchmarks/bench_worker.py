@@ -0,0 +1,219 @@
+# coding: utf8
+"""
+Sqlite3Worker 常用操作的性能测试，结果以 JSON 输出，方便不同版本之间对比。
+
+    python benchmarks/bench_worker.py --sizes 1000 100000 --output result.json
+
+不需要联网，数据库使用 :memory: 和临时文件。没有安装 cryptography 时跳过加密列的测试。
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Sqlite3Helper import (  # noqa: E402
+    __version__, Sqlite3Worker, Column, DataType, Table, Operand,
+    generate_key_and_stuff, order, SortOption,
+)
+
+
+@dataclass
+class BenchCol(Table):
+    table: str = "bench"
+
+    row_id = Column("row_id", DataType.INTEGER, primary_key=True)
+    name = Column("name", DataType.TEXT, nullable=False)
+    age = Column("age", DataType.INTEGER)
+    salary = Column("salary", DataType.REAL)
+    data = Column("data", DataType.BLOB)
+    secure_data = Column("secure_data", DataType.BLOB, secure=True)
+
+
+B = BenchCol()
+
+
+def has_crypto() -> bool:
+    try:
+        generate_key_and_stuff()
+    except ModuleNotFoundError:
+        return False
+    return True
+
+
+def make_rows(size: int, secure: bool) -> list[list]:
+    if secure:
+        return [[f"name{i}", i % 100, i * 1.5, b"x" * 32, b"s" * 32] for i in range(size)]
+    return [[f"name{i}", i % 100, i * 1.5, b"x" * 32] for i in range(size)]
+
+
+def row_columns(secure: bool) -> list[Column]:
+    columns = [B.name, B.age, B.salary, B.data]
+    if secure:
+        columns.append(B.secure_data)
+    return columns
+
+
+class Case(object):
+    """一个测试项，run 是被计时的部分，返回处理的行数或执行的语句数"""
+
+    def __init__(self, name: str, db: str, size: int, secure: bool,
+                 run: Callable[[Sqlite3Worker], int], prefill: bool = False):
+        self.name = name
+        self.db = db
+        self.size = size
+        self.secure = secure
+        self._run = run
+        self._prefill = prefill
+
+    def _make_worker(self, tmp_dir: str) -> Sqlite3Worker:
+        path = ":memory:" if self.db == "memory" else os.path.join(tmp_dir, f"{self.name}.db")
+        if path != ":memory:" and os.path.exists(path):
+            os.remove(path)
+        key_info = generate_key_and_stuff() if self.secure else (None, None, None)
+        sqh = Sqlite3Worker(path, *key_info)
+        sqh.create_table(B.table, B.all)
+        if self._prefill:
+            sqh.insert_many(B.table, row_columns(self.secure), make_rows(self.size, self.secure))
+        return sqh
+
+    def measure(self, tmp_dir: str, memory: bool) -> dict:
+        sqh = self._make_worker(tmp_dir)
+        gc.collect()
+        start = time.perf_counter()
+        rows = self._run(sqh)
+        elapsed = time.perf_counter() - start
+        sqh.close()
+
+        result = {
+            "name": self.name, "db": self.db, "size": self.size, "secure": self.secure,
+            "rows": rows, "seconds": round(elapsed, 6),
+            "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None,
+        }
+
+        if memory:
+            # 内存单独再跑一遍，tracemalloc 会明显拖慢速度
+            sqh = self._make_worker(tmp_dir)
+            gc.collect()
+            tracemalloc.start()
+            self._run(sqh)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            sqh.close()
+            result["peak_memory_bytes"] = peak
+        return result
+
+
+def build_cases(sizes: list[int], dbs: list[str], secure_options: list[bool]) -> list[Case]:
+    cases = []
+
+    for db in dbs:
+        for size in sizes:
+            for secure in secure_options:
+                columns = row_columns(secure)
+
+                def insert_into(sqh, size=size, secure=secure, columns=columns):
+                    sqh.insert_into(B.table, columns, make_rows(size, secure))
+                    return size
+
+                def insert_many(sqh, size=size, secure=secure, columns=columns):
+                    sqh.insert_many(B.table, columns, make_rows(size, secure))
+                    return size
+
+                def select(sqh, columns=columns):
+                    _, rows = sqh.select(B.table, columns)
+                    return len(rows)
+
+                def iter_select(sqh, columns=columns):
+                    return sum(1 for _ in sqh.iter_select(B.table, columns, chunk_size=1000))
+
+                cases.append(Case("insert_into", db, size, secure, insert_into))
+                cases.append(Case("insert_many", db, size, secure, insert_many))
+                cases.append(Case("select", db, size, secure, select, prefill=True))
+                cases.append(Case("iter_select", db, size, secure, iter_select, prefill=True))
+
+            def update_complex(sqh):
+                cond = (Operand(B.age).between(10, 30)
+                        .and_(Operand(B.name).like("name1%"))
+                        .or_(Operand(B.salary).in_([1.5, 3.0, 4.5]), high_priority=True))
+                for i in range(100):
+                    sqh.update(B.table, [(B.salary, float(i))], where=cond)
+                return 100
+
+            def delete_complex(sqh, size=size):
+                for i in range(100):
+                    cond = Operand(B.age).equal_to(i).and_(Operand(B.row_id).less_than(size // 2))
+                    sqh.delete_from(B.table, where=cond)
+                return 100
+
+            def select_ordered(sqh):
+                for i in range(100):
+                    sqh.select(B.table, [B.row_id, B.name], where=Operand(B.age).equal_to(i),
+                               order_by=[order(B.salary, SortOption.DESC)], limit=10)
+                return 100
+
+            cases.append(Case("update_complex_where", db, size, False, update_complex, prefill=True))
+            cases.append(Case("delete_complex_where", db, size, False, delete_complex, prefill=True))
+            cases.append(Case("select_ordered_limit", db, size, False, select_ordered, prefill=True))
+
+    def construct(_sqh):
+        count = 10000
+        for _ in range(count):
+            BenchCol()
+            Column("c", DataType.TEXT, nullable=False, has_default=True, default="x")
+        return count
+
+    cases.append(Case("table_construction", "memory", 10000, False, construct))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000],
+                        help="number of rows, e.g. 1000 100000 1000000")
+    parser.add_argument("--db", choices=["memory", "file", "both"], default="both")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory measurement")
+    parser.add_argument("--output", default="", help="write JSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    dbs = ["memory", "file"] if args.db == "both" else [args.db]
+    secure_options = [False, True] if has_crypto() else [False]
+    cases = [case for case in build_cases(args.sizes, dbs, secure_options) if args.filter in case.name]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for case in cases:
+            result = case.measure(tmp_dir, not args.no_memory)
+            print(f"{case.name:<22} {case.db:<7} {case.size:>8} secure={case.secure!s:<5} "
+                  f"{result['rows_per_sec']} rows/s", file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
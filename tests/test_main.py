@@ -1,13 +1,38 @@
 # coding: utf8
+import asyncio
+import array
+import gc
+import io
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from dataclasses import dataclass
 from unittest import TestCase
 from Sqlite3Helper import (
-    Column, DataType,
+    Column, DataType, generate_key_and_stuff,
     NullType, BlobType,
-    Sqlite3Worker, Operand, Expression,
+    Sqlite3Worker, Sqlite3WorkerPool, AsyncSqlite3Worker, ShardedSqlite3Worker, Operand, Expression,
+    order, SortOption, Table, ResultCache, Aggregate, Join,
 )
-from Sqlite3Helper._util_func import to_string
-from Sqlite3Helper._crypto import NotRandomFernet
+from Sqlite3Helper._util_func import to_string, to_param
+from Sqlite3Helper._crypto import NotRandomFernet, get_fernet
+from Sqlite3Helper._cache import StatementCache
+from Sqlite3Helper._instrument import normalize_statement
+from Sqlite3Helper._columnar import load_numpy
+from Sqlite3Helper._column import _table_columns
+
+
+def has_crypto() -> bool:
+    try:
+        generate_key_and_stuff()
+    except ModuleNotFoundError:
+        return False
+    return True
 
 
 class BlobTypeTestCase(TestCase):
@@ -142,6 +167,1072 @@ class CRUDTestCase(TestCase):
         self.assertRaises(ValueError, self.sqh.update, "demo", [(self.name, None)], where=cond, execute=False)
 
 
+class InsertManyTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.time = 1723392234
+        self.iv = b'\x1a\xf86\xf0\xfb"\xf2\xab\x83\xccW\xd8=zqY'
+        self.sqh = Sqlite3Worker(key=self.key, fix_time=self.time, fix_iv=self.iv)
+        self.name = Column("name", DataType.TEXT, nullable=False)
+        self.salary = Column("salary", DataType.REAL)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.sqh.create_table("demo", [self.name, self.salary, self.secure_data])
+
+    def test_statement(self):
+        i1 = self.sqh.insert_many("demo", [self.name, self.salary], [], execute=False)
+        self.assertEqual(i1, "INSERT INTO demo (name, salary) VALUES (?, ?);")
+
+    def test_generator(self):
+        rows = ([f"n{i}", i, "secret"] for i in range(1000))
+        self.sqh.insert_many("demo", [self.name, self.salary, self.secure_data], rows)
+        _, results = self.sqh.select("demo", [self.name, self.salary, self.secure_data],
+                                     where=Operand(self.name).equal_to("n10"))
+        self.assertEqual(results, [["n10", 10.0, b"secret"]])
+
+    def test_same_as_literal(self):
+        self.sqh.insert_into("demo", [self.name, self.secure_data], [["'Karl'", "x"]])
+        self.sqh.insert_many("demo", [self.name, self.secure_data], [["'Karl'", "x"]])
+        _, results = self.sqh.select("demo", [self.name, self.secure_data])
+        self.assertEqual(results[0], results[1])
+
+    def test_type_check(self):
+        self.assertRaises(ValueError, self.sqh.insert_many, "demo", [self.name], [[None]])
+        self.assertRaises(ValueError, self.sqh.insert_many, "demo", [self.name], [["a", "b"]])
+
+    def test_bad_row_rolls_back(self):
+        self.sqh.insert_many("demo", [self.name], [["kept"]], commit=False)
+        self.assertRaises(ValueError, self.sqh.insert_many, "demo", [self.name], [["a"], ["b"], [None]])
+        self.sqh.insert_many("demo", [self.name], [["d"]])
+        _, results = self.sqh.select("demo", [self.name], order_by="name")
+        self.assertEqual(results, [["d"], ["kept"]])
+
+        with self.sqh.transaction():
+            self.sqh.insert_many("demo", [self.name], [["e"]])
+            self.assertRaises(ValueError, self.sqh.insert_many, "demo", [self.name], [["f"], [None]])
+        _, results = self.sqh.select("demo", [self.name], order_by="name")
+        self.assertEqual(results, [["d"], ["e"], ["kept"]])
+
+
+class IterSelectTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.num = Column("num", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.sqh.create_table("demo", [self.num, self.secure_data])
+        self.sqh.insert_many("demo", [self.num, self.secure_data], ([i, f"s{i}"] for i in range(25)))
+
+    def test_same_as_select(self):
+        _, expected = self.sqh.select("demo", [self.num, self.secure_data], order_by="num")
+        rows = list(self.sqh.iter_select("demo", [self.num, self.secure_data], order_by="num", chunk_size=7))
+        self.assertEqual(rows, expected)
+        self.assertEqual(rows[3], [3, b"s3"])
+
+    def test_interleave(self):
+        # 迭代过程中调用其他方法不会影响迭代
+        it = self.sqh.iter_select("demo", [self.num], order_by="num", chunk_size=2)
+        self.assertEqual(next(it), [0])
+        self.sqh.select("demo", [self.num], limit=1)
+        self.assertEqual(len(list(it)), 24)
+
+    def test_chunk_size(self):
+        self.assertRaises(ValueError, list, self.sqh.iter_select("demo", [self.num], chunk_size=0))
+
+
+class TransactionTestCase(TestCase):
+
+    def setUp(self):
+        self.sqh = Sqlite3Worker()
+        self.num = Column("num", DataType.INTEGER)
+        self.sqh.create_table("demo", [self.num])
+        self.sqh.commit()
+
+    def count(self) -> int:
+        _, rows = self.sqh.select("demo", ["count(*)"])
+        return rows[0][0]
+
+    def test_commit_and_rollback(self):
+        with self.sqh.transaction("IMMEDIATE"):
+            self.sqh.insert_into("demo", [self.num], [[1]])
+            self.assertTrue(self.sqh.in_transaction)
+        self.assertFalse(self.sqh.in_transaction)
+        self.assertEqual(self.count(), 1)
+
+        with self.assertRaises(KeyError):
+            with self.sqh.transaction():
+                self.sqh.insert_into("demo", [self.num], [[2]])
+                raise KeyError
+        self.assertEqual(self.count(), 1)
+        self.assertRaises(ValueError, self.sqh.transaction("SOMETIMES").__enter__)
+
+    def test_savepoint(self):
+        with self.sqh.transaction():
+            self.sqh.insert_into("demo", [self.num], [[1]])
+            with self.assertRaises(KeyError):
+                with self.sqh.transaction():
+                    self.sqh.insert_into("demo", [self.num], [[2]])
+                    raise KeyError
+            with self.sqh.transaction():
+                self.sqh.insert_into("demo", [self.num], [[3]])
+        _, rows = self.sqh.select("demo", [self.num], order_by="num")
+        self.assertEqual(rows, [[1], [3]])
+
+    def test_batch(self):
+        with self.assertRaises(KeyError):
+            with self.sqh.batch(3):
+                for i in range(7):
+                    self.sqh.insert_into("demo", [self.num], [[i]])
+                raise KeyError
+        # 前两批已经提交，最后一批被回滚
+        self.assertEqual(self.count(), 6)
+        self.assertFalse(self.sqh.in_transaction)
+
+        with self.sqh.transaction():
+            self.assertRaises(ValueError, self.sqh.batch(3).__enter__)
+
+
+class PoolTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.tmp = tempfile.TemporaryDirectory()
+        self.time = 1723392234
+        self.iv = b'\x1a\xf86\xf0\xfb"\xf2\xab\x83\xccW\xd8=zqY'
+        self.pool = Sqlite3WorkerPool(os.path.join(self.tmp.name, "demo.db"), self.key, self.time, self.iv,
+                                      readers=2, timeout=1)
+        self.num = Column("num", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.pool.create_table("demo", [self.num, self.secure_data])
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp.cleanup()
+
+    def test_read_write(self):
+        self.pool.insert_many("demo", [self.num, self.secure_data], [[1, "a"], [2, "b"]])
+        _, rows = self.pool.select("demo", [self.num, self.secure_data],
+                                   where=Operand(self.secure_data, self.key, self.time, self.iv).equal_to("b"))
+        self.assertEqual(rows, [[2, b"b"]])
+        self.assertEqual(self.pool.show_tables(), ["demo"])
+        _, journal = self.pool.select("pragma_journal_mode", ["journal_mode"])
+        self.assertEqual(journal, [["wal"]])
+
+    def test_threads(self):
+        errors = []
+
+        def write(start: int):
+            try:
+                with self.pool.transaction():
+                    for i in range(start, start + 50):
+                        self.pool.insert_into("demo", [self.num], [[i]])
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                for _ in range(20):
+                    self.pool.select("demo", [self.num])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(i * 50,)) for i in range(4)]
+        threads.extend(threading.Thread(target=read) for _ in range(4))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        _, rows = self.pool.select("demo", ["count(*)"])
+        self.assertEqual(rows, [[200]])
+
+    def test_profile_keeps_wal(self):
+        for profile in ("durable", "bulk_load"):
+            path = os.path.join(self.tmp.name, f"{profile}.db")
+            pool = Sqlite3WorkerPool(path, readers=2, profile=profile)
+            with pool.reader() as worker:
+                self.assertEqual(worker.pragma("journal_mode"), "wal")
+            with pool.writer() as worker:
+                self.assertEqual(worker.pragma("synchronous"), 2 if profile == "durable" else 0)
+            pool.close()
+            self.assertEqual(Sqlite3Worker(path).pragma("journal_mode"), "wal")
+
+    def test_cache_rolled_back(self):
+        path = os.path.join(self.tmp.name, "cache.db")
+        pool = Sqlite3WorkerPool(path, readers=2, result_cache=ResultCache(max_rows=100))
+        pool.create_table("demo", [self.num])
+        try:
+            with pool.transaction() as worker:
+                worker.insert_into("demo", [self.num], [[1]])
+                self.assertEqual(worker.select("demo", [self.num])[1], [[1]])
+                # 只读连接看不到还没提交的行，也不能从缓存中拿到
+                self.assertEqual(pool.select("demo", [self.num])[1], [])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(pool.select("demo", [self.num])[1], [])
+        pool.close()
+
+    def test_timeout(self):
+        with self.pool.reader(), self.pool.reader():
+            self.assertRaises(TimeoutError, self.pool.reader(timeout=0.01).__enter__)
+        self.assertRaises(ValueError, Sqlite3WorkerPool, ":memory:")
+
+
+class ShardTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.uid = Column("uid", DataType.INTEGER, primary_key=True)
+        self.name = Column("name", DataType.TEXT)
+        self.score = Column("score", DataType.REAL)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.columns = [self.uid, self.name, self.score, self.secure_data]
+        self.rows = [[i, f"n{i % 7}", None if i % 5 == 0 else float(i % 13), f"s{i}"] for i in range(100)]
+
+    def make(self, **kwargs) -> ShardedSqlite3Worker:
+        sqh = ShardedSqlite3Worker([":memory:"] * 3, self.uid, key=self.key, **kwargs)
+        sqh.create_table("demo", self.columns)
+        sqh.insert_many("demo", self.columns, self.rows)
+        return sqh
+
+    def test_hash(self):
+        sqh = self.make()
+        counts = [len(shard.select("demo", [self.uid])[1]) for shard in sqh.shards]
+        self.assertEqual(sum(counts), 100)
+        self.assertTrue(all(count > 0 for count in counts))
+        index = sqh.shard_of(42)
+        self.assertEqual(sqh.shards[index].select("demo", [self.name], where=sqh.operand(self.uid).equal_to(42))[1], [["n0"]])
+
+        _, rows = sqh.select("demo", [self.name, self.secure_data], order_by=order(self.uid, SortOption.DESC),
+                             limit=3, offset=2)
+        self.assertEqual(rows, [["n6", b"s97"], ["n5", b"s96"], ["n4", b"s95"]])
+        _, rows = sqh.select("demo", [self.uid, self.score], order_by=["score", "uid"], limit=22)
+        expected = sorted(([r[0], r[2]] for r in self.rows), key=lambda r: (r[1] is not None, r[1] or 0, r[0]))
+        self.assertEqual(rows, expected[:22])
+        _, rows = sqh.select("demo", [self.name], distinct=True, order_by="name DESC")
+        self.assertEqual(rows, [[f"n{i}"] for i in range(6, -1, -1)])
+        _, rows = sqh.select("demo", [self.uid], where=sqh.operand(self.secure_data).equal_to("s5"), row_type="tuple")
+        self.assertEqual(rows, [(5,)])
+        _, rows = sqh.select("demo", ["uid AS u"], where=sqh.operand(self.uid).equal_to(5), row_type="dict")
+        self.assertEqual(rows, [{"u": 5}])
+        self.assertRaises(ValueError, sqh.select, "demo", [self.secure_data], order_by="secure_data")
+        self.assertRaises(ValueError, sqh.select, "demo", [Aggregate.count()])
+        self.assertRaises(ValueError, sqh.select, "demo", [self.name, Aggregate.max(self.score, alias="m")],
+                          group_by=self.name)
+        self.assertRaises(ValueError, sqh.select, "demo", [self.name], group_by=self.name)
+        self.assertEqual(sqh.count("demo", sqh.operand(self.score).is_null()), 20)
+        sqh.close()
+
+    def test_write(self):
+        sqh = self.make(boundaries=[30, 60])
+        self.assertEqual([len(shard.select("demo", [self.uid])[1]) for shard in sqh.shards], [30, 30, 40])
+        sqh.update("demo", [(self.name, "x")], sqh.operand(self.uid).equal_to(70))
+        sqh.update("demo", [(self.score, -1.0)], sqh.operand(self.uid).less_than(3))
+        sqh.delete_from("demo", sqh.operand(self.uid).greater_equal(90))
+        _, rows = sqh.select("demo", [self.uid, self.name, self.score],
+                             where=sqh.operand(self.score).less_than(0).or_(sqh.operand(self.name).equal_to("x")),
+                             order_by=self.uid)
+        self.assertEqual(rows, [[0, "n0", -1.0], [1, "n1", -1.0], [2, "n2", -1.0], [70, "x", None]])
+        self.assertEqual(len(sqh.select("demo", [])[1]), 90)
+        self.assertRaises(ValueError, sqh.update, "demo", [(self.uid, 1)])
+        self.assertRaises(ValueError, sqh.insert_many, "demo", [self.name], [["a"]])
+        self.assertRaises(ValueError, sqh.insert_many, "demo", self.columns, [], batch_size=0)
+
+        # 按块取出生成器中的行，每块分别路由
+        sqh.insert_many("demo", self.columns, (row[:3] + [None] for row in self.rows[90:] + [[100, "a", 1.0]]),
+                        batch_size=4)
+        self.assertEqual(sqh.count("demo"), 101)
+        self.assertEqual([len(shard.select("demo", [self.uid])[1]) for shard in sqh.shards], [30, 30, 41])
+        self.assertRaises(ValueError, ShardedSqlite3Worker, [":memory:"] * 2, self.uid, boundaries=[1, 2])
+        sqh.close()
+
+
+class StatementCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.sqh = Sqlite3Worker(statement_cache_size=2)
+        self.num = Column("num", DataType.INTEGER)
+        self.sqh.create_table("demo", [self.num])
+        self.sqh.insert_many("demo", [self.num], [[i] for i in range(10)])
+
+    def test_select(self):
+        s1, r1 = self.sqh.select("demo", [self.num], order_by="num", limit=2, offset=3)
+        s2, r2 = self.sqh.select("demo", [self.num], order_by="num", limit=3, offset=5)
+        self.assertEqual(s1, "SELECT num FROM demo ORDER BY num LIMIT ? OFFSET ?;")
+        self.assertIs(s1, s2)
+        self.assertEqual(r1, [[3], [4]])
+        self.assertEqual(r2, [[5], [6], [7]])
+        self.assertEqual(self.sqh.statement_cache_info()[:2], (1, 1))
+
+        s3, _ = self.sqh.select("demo", [self.num], limit=2, offset=3, execute=False)
+        self.assertEqual(s3, "SELECT num FROM demo LIMIT 2 OFFSET 3;")
+
+    def test_update_delete(self):
+        u1 = self.sqh.update("demo", [(self.num, 100)], where=Expression("num = 1"))
+        self.assertEqual(u1, "UPDATE demo SET num = ? WHERE num = 1;")
+        d1 = self.sqh.delete_from("demo", where=Expression("num = 100"))
+        self.assertEqual(d1, "DELETE FROM demo WHERE num = 100;")
+        _, rows = self.sqh.select("demo", ["count(*)"])
+        self.assertEqual(rows, [[9]])
+
+    def test_lru(self):
+        cache = StatementCache(2)
+        cache.get("a", lambda: "A")
+        cache.get("b", lambda: "B")
+        cache.get("a", lambda: "A")
+        cache.get("c", lambda: "C")
+        self.assertEqual(cache.get("a", lambda: "X"), "A")
+        self.assertEqual(cache.get("b", lambda: "X"), "X")
+        self.assertEqual(tuple(cache.info()), (2, 4, 2, 2))
+        self.assertEqual(StatementCache(0).get("a", lambda: "A"), "A")
+
+
+class CryptoExecutorTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.time = 1723392234
+        self.iv = b'\x1a\xf86\xf0\xfb"\xf2\xab\x83\xccW\xd8=zqY'
+        self.num = Column("num", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+
+    def check(self, executor: str):
+        plain = Sqlite3Worker(key=self.key, fix_time=self.time, fix_iv=self.iv)
+        sqh = Sqlite3Worker(key=self.key, fix_time=self.time, fix_iv=self.iv,
+                            crypto_executor=executor, crypto_workers=2)
+        rows = [[i, f"s{i}" if i % 3 else None] for i in range(50)]
+        self.assertEqual(sqh.insert_into("demo", [self.num, self.secure_data], rows, execute=False),
+                         plain.insert_into("demo", [self.num, self.secure_data], rows, execute=False))
+
+        sqh.create_table("demo", [self.num, self.secure_data])
+        sqh.insert_many("demo", [self.num, self.secure_data], rows)
+        # 不是密文的数据解密失败时原样返回
+        sqh.insert_into("demo", ["num", "secure_data"], [[50, b"plain"]])
+        _, results = sqh.select("demo", [self.num, self.secure_data], order_by="num")
+        self.assertEqual(results[:4], [[0, None], [1, b"s1"], [2, b"s2"], [3, None]])
+        self.assertEqual(results[-1], [50, b"plain"])
+        self.assertEqual(list(sqh.iter_select("demo", [self.num, self.secure_data],
+                                              order_by="num", chunk_size=7)), results)
+        sqh.close()
+
+    def test_thread(self):
+        self.check("thread")
+
+    def test_process(self):
+        self.check("process")
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, Sqlite3Worker, crypto_executor="fiber")
+
+
+class PragmaTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "demo.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_profile(self):
+        sqh = Sqlite3Worker(self.path, profile="read_heavy", cache_size=-1024, page_size=8192)
+        pragmas = sqh.pragmas()
+        self.assertEqual(pragmas["journal_mode"], "wal")
+        self.assertEqual(pragmas["synchronous"], 1)
+        self.assertEqual(pragmas["cache_size"], -1024)
+        self.assertEqual(pragmas["page_size"], 8192)
+        self.assertEqual(pragmas["temp_store"], 2)
+        self.assertEqual(sqh.pragma("busy_timeout"), 5000)
+        sqh.close()
+
+        sqh = Sqlite3Worker(self.path, profile="bulk_load")
+        self.assertEqual(sqh.pragma("synchronous"), 0)
+        sqh.close()
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Sqlite3Worker, profile="fast")
+        self.assertRaises(ValueError, Sqlite3Worker, journal_mode="WAL; DROP TABLE demo")
+        self.assertRaises(ValueError, Sqlite3Worker, cache_size="1")
+        self.assertRaises(ValueError, Sqlite3Worker().pragma, "user_version")
+
+
+class InstrumentTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key, instrument=True)
+        self.num = Column("num", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.sqh.create_table("demo", [self.num, self.secure_data])
+
+    def test_normalize(self):
+        self.assertEqual(normalize_statement("INSERT INTO t1 (a, b) VALUES (1, 'x''y'), (-2.5, X'00ff');"),
+                         "INSERT INTO t1 (a, b) VALUES (...);")
+        self.assertEqual(normalize_statement("SELECT a FROM t WHERE b IN (?, ?) LIMIT ?;"),
+                         "SELECT a FROM t WHERE b IN (...) LIMIT ?;")
+
+    def test_stats(self):
+        calls = []
+        self.sqh.add_hook(before=lambda st, ps: calls.append(("before", st)),
+                          after=lambda st, ps, el, rc: calls.append(("after", rc)))
+        self.sqh.insert_into("demo", [self.num, self.secure_data], [[1, "a"], [2, "b"]])
+        self.sqh.insert_into("demo", [self.num, self.secure_data], [[3, "c"]])
+        for i in range(3):
+            self.sqh.select("demo", [self.num, self.secure_data], where=Operand(self.num).greater_than(i))
+        self.assertEqual(calls[1], ("after", 2))
+
+        stats = {s.statement: s for s in self.sqh.stats()}
+        insert = stats["INSERT INTO demo (num, secure_data) VALUES (...);"]
+        self.assertEqual((insert.calls, insert.rows), (2, 3))
+        select = stats["SELECT num, secure_data FROM demo WHERE num > ?;"]
+        self.assertEqual((select.calls, select.rows), (3, 6))
+        self.assertGreater(select.mean_time, 0)
+        self.assertEqual(set(self.sqh.timings()), {"encrypt", "decrypt", "build"})
+        sqh = Sqlite3Worker(instrument=True)
+        sqh.create_table("plain", [self.num])
+        sqh.insert_into("plain", [self.num], [[1], [2]])
+        self.assertEqual(set(sqh.timings()), {"build"})
+
+        self.sqh.reset_stats()
+        self.assertEqual(self.sqh.stats(), [])
+        self.assertEqual(Sqlite3Worker().stats(), [])
+
+    def test_slow_query(self):
+        sqh = Sqlite3Worker(slow_query_threshold=0)
+        with self.assertLogs("Sqlite3Helper", "WARNING") as cm:
+            sqh.select("sqlite_schema", ["name"])
+        self.assertIn("SELECT name FROM sqlite_schema;", cm.output[0])
+
+
+class AsyncWorkerTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.num = Column("num", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+
+    async def fill(self, aw: AsyncSqlite3Worker):
+        await aw.create_table("demo", [self.num, self.secure_data])
+        # 同时提交的多个调用按顺序在连接线程中执行
+        await asyncio.gather(*[
+            aw.insert_into("demo", [self.num, self.secure_data], [[i, f"s{i}"]]) for i in range(20)
+        ])
+
+    def test_memory(self):
+        async def main():
+            async with AsyncSqlite3Worker(key=self.key) as aw:
+                await self.fill(aw)
+                self.assertEqual(await aw.show_tables(), ["demo"])
+                _, rows = await aw.select("demo", [self.num, self.secure_data], order_by="num")
+                self.assertEqual(rows[5], [5, b"s5"])
+                streamed = [row async for row in aw.iter_select("demo", [self.num, self.secure_data],
+                                                                order_by="num", chunk_size=3)]
+                self.assertEqual(streamed, rows)
+
+                def swap(w: Sqlite3Worker):
+                    with w.transaction():
+                        w.delete_from("demo", where=Operand(self.num).less_than(10))
+                        return w.select("demo", ["count(*)"])[1][0][0]
+
+                self.assertEqual(await aw.run(swap), 10)
+                with self.assertRaises(ValueError):
+                    await aw.insert_into("demo", [self.num], [["x"]])
+            with self.assertRaises(ValueError):
+                await aw.select("demo", [self.num])
+
+        asyncio.run(main())
+
+    def test_readers(self):
+        async def main():
+            with tempfile.TemporaryDirectory() as tmp:
+                aw = AsyncSqlite3Worker(os.path.join(tmp, "demo.db"), self.key, readers=2)
+                await self.fill(aw)
+                results = await asyncio.gather(*[
+                    aw.select("demo", [self.secure_data], where=Operand(self.num).equal_to(i)) for i in range(20)
+                ])
+                self.assertEqual([rows for _, rows in results], [[[f"s{i}".encode()]] for i in range(20)])
+                await aw.close()
+
+        asyncio.run(main())
+
+
+class IndexTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.name = Column("name", DataType.TEXT)
+        self.age = Column("age", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.sqh.create_table("demo", [self.name, self.age, self.secure_data])
+
+    def test_statement(self):
+        c1 = self.sqh.create_index("idx_demo_name", "demo", [self.name, order(self.age, SortOption.DESC)],
+                                   unique=True, if_not_exists=True, execute=False)
+        self.assertEqual(c1, "CREATE UNIQUE INDEX IF NOT EXISTS idx_demo_name ON demo (name, age DESC);")
+        c2 = self.sqh.create_index("idx_demo_lower", "demo", ["lower(name)"],
+                                   where=Operand(self.age).greater_than(18), execute=False)
+        self.assertEqual(c2, "CREATE INDEX idx_demo_lower ON demo (lower(name)) WHERE age > 18;")
+        self.assertEqual(self.sqh.drop_index("idx_demo_name", if_exists=True, execute=False),
+                         "DROP INDEX IF EXISTS idx_demo_name;")
+        self.assertRaises(ValueError, self.sqh.create_index, "idx", "demo", [])
+
+    def test_explain_and_advise(self):
+        cond = self.sqh.operand(self.secure_data).equal_to("x").and_(Operand(self.age).greater_than(3))
+        self.assertEqual(cond.columns, ("secure_data", "age"))
+        plan = self.sqh.explain("demo", [self.name], where=cond)
+        self.assertTrue(any(step.scans("demo") for step in plan))
+
+        self.sqh.select("demo", [self.name], where=cond)
+        self.sqh.delete_from("demo", where=Operand(self.name).equal_to("a"))
+        advices = self.sqh.advise_indexes()
+        self.assertEqual([a.columns for a in advices], [("secure_data", "age"), ("name",)])
+        self.assertEqual(advices[1].statement, "CREATE INDEX IF NOT EXISTS idx_demo_name ON demo (name);")
+
+        for advice in advices:
+            self.sqh._execute(advice.statement)
+        self.assertFalse(any(step.scans("demo") for step in self.sqh.explain("demo", [self.name], where=cond)))
+        self.assertEqual(self.sqh.advise_indexes(), [])
+
+
+class UpsertTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.uid = Column("uid", DataType.INTEGER, primary_key=True)
+        self.name = Column("name", DataType.TEXT)
+        self.age = Column("age", DataType.INTEGER)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.sqh.create_table("demo", [self.uid, self.name, self.age, self.secure_data])
+        self.sqh.insert_many("demo", [self.uid, self.name, self.age], [[i, f"n{i}", i] for i in range(5)])
+
+    def rows(self) -> list[list]:
+        return self.sqh.select("demo", [self.uid, self.name, self.age, self.secure_data], order_by="uid")[1]
+
+    def test_upsert(self):
+        u1 = self.sqh.upsert("demo", [self.uid, self.name, self.age], [[3, "x", 30], [7, "y", 70]],
+                             conflict_columns=[self.uid])
+        self.assertEqual(u1, "INSERT INTO demo (uid, name, age) VALUES (?, ?, ?) "
+                             "ON CONFLICT (uid) DO UPDATE SET name = excluded.name, age = excluded.age;")
+        rows = self.rows()
+        self.assertEqual(rows[3], [3, "x", 30, None])
+        self.assertEqual(rows[-1], [7, "y", 70, None])
+
+        self.sqh.upsert("demo", [self.uid, self.name, self.secure_data], [[1, "z", "s1"]],
+                        conflict_columns=[self.uid], update_columns=[self.secure_data])
+        self.assertEqual(self.rows()[1], [1, "n1", 1, b"s1"])
+
+        u2 = self.sqh.upsert("demo", [self.uid, self.name], [[2, "w"]], [self.uid], [])
+        self.assertTrue(u2.endswith("ON CONFLICT (uid) DO NOTHING;"))
+        self.assertEqual(self.rows()[2][1], "n2")
+        self.assertRaises(ValueError, self.sqh.upsert, "demo", [self.age], [["a"]], [self.uid])
+
+    def test_bulk_update(self):
+        b1 = self.sqh.bulk_update("demo", self.uid, [self.name, self.secure_data],
+                                  ([i, f"m{i}", f"s{i}"] for i in range(0, 5, 2)))
+        self.assertEqual(b1, "UPDATE demo SET name = ?, secure_data = ? WHERE uid = ?;")
+        rows = self.rows()
+        self.assertEqual(rows[2], [2, "m2", 2, b"s2"])
+        self.assertEqual(rows[1], [1, "n1", 1, None])
+
+        # 加密的列作为键时同样先加密再比较
+        self.sqh.bulk_update("demo", self.secure_data, [self.age], [["s4", 40]])
+        self.assertEqual(self.rows()[4][2], 40)
+
+
+class PaginateTestCase(TestCase):
+
+    def setUp(self):
+        self.sqh = Sqlite3Worker()
+        self.uid = Column("uid", DataType.INTEGER, primary_key=True)
+        self.grp = Column("grp", DataType.INTEGER)
+        self.name = Column("name", DataType.TEXT)
+        self.sqh.create_table("demo", [self.uid, self.grp, self.name])
+        self.sqh.insert_many("demo", [self.uid, self.grp, self.name], [[i, i % 3, f"n{i}"] for i in range(23)])
+
+    def check(self, order_by: list, page_size: int = 5, where: Expression = None):
+        _, expected = self.sqh.select("demo", [self.name, self.grp], where=where, order_by=order_by)
+        pages = list(self.sqh.paginate("demo", [self.name, self.grp], order_by=order_by,
+                                       page_size=page_size, where=where))
+        self.assertTrue(all(len(page) <= page_size for page in pages))
+        self.assertEqual([row for page in pages for row in page], expected)
+
+    def test_single(self):
+        self.check([order(self.uid)])
+        self.check([order(self.uid, SortOption.DESC)], page_size=23)
+        self.check(["uid"], page_size=1)
+
+    def test_composite(self):
+        self.check([order(self.grp), order(self.uid)])
+        self.check([order(self.grp, SortOption.DESC), order(self.uid, SortOption.DESC)], page_size=4)
+        self.check([order(self.grp, SortOption.DESC), order(self.uid, SortOption.ASC)], page_size=4)
+
+    def test_where(self):
+        cond = Operand(self.grp).equal_to(1).or_(Operand(self.uid).less_than(5))
+        self.check([order(self.uid, SortOption.DESC)], page_size=3, where=cond)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, list, self.sqh.paginate("demo", [self.name], [], page_size=3))
+        self.assertRaises(ValueError, list, self.sqh.paginate("demo", [self.name], "uid", page_size=0))
+
+
+@dataclass
+class PersonsCol(Table):
+    table: str = "persons"
+
+    person_id = Column("person_id", DataType.INTEGER, primary_key=True)
+    name = Column("name", DataType.TEXT, nullable=False)
+    secure_data = Column("secure_data", DataType.BLOB, secure=True)
+
+
+class RowTypeTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.p = PersonsCol()
+        self.sqh.create_table(self.p.table, self.p.all)
+        self.sqh.insert_many(self.p.table, [self.p.name, self.p.secure_data], [["John", "a"], ["Liz", None]])
+
+    def test_row_types(self):
+        p = self.p
+        _, rows = self.sqh.select(p.table, [p.person_id, p.name], row_type="tuple")
+        self.assertEqual(rows, [(1, "John"), (2, "Liz")])
+        _, rows = self.sqh.select(p.table, [p.name, p.secure_data], row_type="dict")
+        self.assertEqual(rows, [{"name": "John", "secure_data": b"a"}, {"name": "Liz", "secure_data": None}])
+        # SELECT * 不知道哪些列是加密的，不会解密
+        _, rows = self.sqh.select(p.table, [], row_type="dict", limit=1)
+        self.assertEqual(list(rows[0]), ["person_id", "name", "secure_data"])
+
+        _, rows = self.sqh.select(p.table, [p.person_id, p.secure_data], row_type=p)
+        self.assertEqual(type(rows[0]).__name__, "PersonsColRow")
+        self.assertEqual((rows[0].person_id, rows[0].secure_data), (1, b"a"))
+        _, rows2 = self.sqh.select(p.table, [p.person_id, p.secure_data], row_type=PersonsCol)
+        self.assertIs(type(rows[0]), type(rows2[0]))
+
+        records = list(self.sqh.iter_select(p.table, [p.name, "count(*)"], row_type="record"))
+        self.assertEqual(records[0].name, "John")
+        self.assertEqual(records[0][1], 2)
+        pages = list(self.sqh.paginate(p.table, [p.name], order_by=p.person_id, page_size=1, row_type="tuple"))
+        self.assertEqual(pages, [[("John",)], [("Liz",)]])
+        self.assertRaises(ValueError, self.sqh.select, p.table, [p.name], row_type="set")
+
+
+class SchemaTestCase(TestCase):
+
+    def setUp(self):
+        self.sqh = Sqlite3Worker()
+        self.p = PersonsCol()
+        self.sqh.create_table(self.p.table, self.p.all)
+        self.sqh.create_table("extra", [
+            Column("code", DataType.TEXT, unique=True, has_default=True, default="it's"),
+            Column("_rate", DataType.REAL, nullable=False, has_default=True, default=1),
+            Column("data", DataType.BLOB, has_default=True, default=b"\x01"),
+        ])
+        self.sqh.create_index("idx_persons_name", self.p.table, [self.p.name])
+
+    def test_catalog(self):
+        self.assertEqual(self.sqh.show_tables(), ["persons", "extra"])
+        columns = self.sqh.table_columns("persons")
+        self.assertEqual([c.name for c in columns], ["person_id", "name", "secure_data"])
+        self.assertEqual((columns[1].type, columns[1].notnull, columns[0].pk), ("TEXT", True, 1))
+        indexes = self.sqh.table_indexes("persons")
+        self.assertEqual([(i.name, i.columns) for i in indexes], [("idx_persons_name", ("name",))])
+        self.assertEqual(self.sqh.table_columns("missing"), [])
+
+        self.sqh.drop_index("idx_persons_name")
+        self.assertEqual(self.sqh.table_indexes("persons"), [])
+        self.sqh.rename_table("extra", "extra2")
+        self.assertEqual(self.sqh.show_tables(), ["persons", "extra2"])
+
+    def test_schema_version(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.db")
+            a = Sqlite3Worker(path)
+            b = Sqlite3Worker(path)
+            self.assertEqual(a.show_tables(), [])
+            b.create_table("demo", [Column("num", DataType.INTEGER)])
+            self.assertEqual(a.show_tables(), ["demo"])
+            a.close()
+            b.close()
+
+    def test_reflect(self):
+        p = self.sqh.reflect_table("persons", secure=["secure_data"])
+        self.assertIsInstance(p, Table)
+        self.assertEqual(type(p).__name__, "Persons")
+        self.assertEqual(p.table, "persons")
+        self.assertEqual([str(c) for c in p.all], [str(c) for c in self.p.all])
+        self.assertTrue(p.secure_data.secure)
+
+        e = self.sqh.reflect_table("extra")
+        self.assertEqual([str(c) for c in e.all],
+                         ["code TEXT UNIQUE DEFAULT 'it''s'", "_rate REAL NOT NULL DEFAULT 1.0", "data BLOB DEFAULT X'01'"])
+        self.assertIs(e._rate_, e.all[1])
+        self.assertRaises(ValueError, self.sqh.reflect_table, "missing")
+
+        # 列的查找每个类只做一次，实例之间互不影响
+        self.assertEqual(len(type(e)().all), 3)
+        self.assertEqual(len(e.all), 3)
+
+    def test_reflect_no_leak(self):
+        self.sqh.reflect_table("extra")
+        gc.collect()
+        count = len(_table_columns)
+        for _ in range(10):
+            self.sqh.reflect_table("extra")
+        gc.collect()
+        self.assertEqual(len(_table_columns), count)
+
+
+@dataclass
+class OrdersCol(Table):
+    table: str = "orders"
+
+    order_id = Column("order_id", DataType.INTEGER, primary_key=True)
+    person_id = Column("person_id", DataType.INTEGER)
+    amount = Column("amount", DataType.REAL)
+    note = Column("note", DataType.BLOB, secure=True)
+
+
+class JoinTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.cache = ResultCache(max_rows=100)
+        self.sqh = Sqlite3Worker(key=self.key, result_cache=self.cache)
+        self.p = PersonsCol()
+        self.o = OrdersCol()
+        self.sqh.create_table(self.p.table, self.p.all)
+        self.sqh.create_table(self.o.table, self.o.all)
+        self.sqh.insert_many(self.p.table, [self.p.name, self.p.secure_data], [["John", "a"], ["Liz", "b"]])
+        self.sqh.insert_many(self.o.table, [self.o.person_id, self.o.amount, self.o.note],
+                             [[1, 10.0, "x"], [1, 20.0, "y"], [1, 5.0, None]])
+        p, o = self.p, self.o
+        self.on = Operand(p.qualified(p.person_id)).equal_to_column(o.qualified(o.person_id))
+
+    def test_qualified(self):
+        column = self.p.qualified(self.p.secure_data)
+        self.assertEqual(column.name, "persons.secure_data")
+        self.assertTrue(column.secure)
+        self.assertEqual(self.p.secure_data.name, "secure_data")
+        self.assertEqual(self.p.qualified("name"), "persons.name")
+        self.assertEqual(str(self.on), "persons.person_id = orders.person_id")
+
+    def test_join(self):
+        p, o = self.p, self.o
+        join = Join(p).inner(o, self.on.and_(Operand(o.qualified(o.amount)).greater_than(6)))
+        columns = [p.qualified(p.name), p.qualified(p.secure_data), o.qualified(o.amount), o.qualified(o.note)]
+        statement, rows = self.sqh.select(join, columns, order_by=o.qualified(o.amount).name, limit=5)
+        self.assertEqual(statement, "SELECT persons.name, persons.secure_data, orders.amount, orders.note "
+                                    "FROM persons INNER JOIN orders ON persons.person_id = orders.person_id "
+                                    "AND orders.amount > ? ORDER BY orders.amount LIMIT ?;")
+        self.assertEqual(rows, [["John", b"a", 10.0, b"x"], ["John", b"a", 20.0, b"y"]])
+        statement, _ = self.sqh.select(join, columns, limit=5, execute=False)
+        self.assertIn("AND orders.amount > 6 LIMIT 5", statement)
+        self.assertEqual(Join(PersonsCol).inner(OrdersCol, self.on).sql, Join(p).inner(o, self.on).sql)
+        self.assertRaises(ValueError, Join, Table)
+
+        _, rows = self.sqh.select(join, columns[:3], order_by="orders.amount", row_type="record")
+        self.assertEqual((rows[0].name, rows[0].secure_data, rows[0].amount), ("John", b"a", 10.0))
+        _, rows = self.sqh.select(join, [p.qualified(p.name)], limit=1, row_type=PersonsCol)
+        self.assertEqual(rows[0].name, "John")
+        self.assertRaises(ValueError, self.sqh.select, join, [p.qualified(p.person_id), o.qualified(o.person_id)],
+                          row_type="record")
+
+        left = Join(p).left(o, self.on)
+        _, rows = self.sqh.select(left, [p.qualified(p.name), Aggregate.count(o.qualified(o.order_id), alias="n")],
+                                  group_by=p.qualified(p.name), order_by="persons.name", row_type="dict")
+        self.assertEqual(rows, [{"persons.name": "John", "n": 3}, {"persons.name": "Liz", "n": 0}])
+        self.assertEqual(self.sqh.count(left), 4)
+
+        # 任何一个表被修改都会清除连接查询的结果
+        self.sqh.delete_from(o.table, Operand(o.order_id).equal_to(1))
+        self.assertEqual(self.sqh.count(left), 3)
+        self.assertRaises(ValueError, Join(p).inner, o, "persons.person_id = orders.person_id")
+
+
+class ColumnarTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.num = Column("num", DataType.INTEGER, nullable=False)
+        self.score = Column("score", DataType.REAL)
+        self.secure_data = Column("secure_data", DataType.BLOB, secure=True)
+        self.columns = [self.num, self.score, self.secure_data]
+        self.sqh.create_table("demo", self.columns)
+
+    def test_array(self):
+        self.sqh.insert_columns("demo", self.columns, [
+            array.array("q", range(5)), [0.5, None, 2.5, 3, None], [b"a", b"b", None, b"d", b"e"],
+        ], chunk_size=2)
+        result = self.sqh.select_columns("demo", self.columns, order_by="num", chunk_size=2, use_numpy=False)
+        self.assertEqual(result["num"].values, array.array("q", range(5)))
+        self.assertIsNone(result["num"].mask)
+        self.assertEqual(result["score"].values, array.array("d", [0.5, 0, 2.5, 3, 0]))
+        self.assertEqual(result["score"].mask, array.array("b", [0, 1, 0, 0, 1]))
+        self.assertEqual(result["secure_data"].values, [b"a", b"b", None, b"d", b"e"])
+
+        self.assertRaises(ValueError, self.sqh.insert_columns, "demo", self.columns, [[1], [1.0]])
+        self.assertRaises(ValueError, self.sqh.insert_columns, "demo", [self.num, self.score], [[1], [1.0, 2.0]])
+
+    def test_mixed_types(self):
+        # INTEGER 列中存了 REAL ，REAL 列中存了 TEXT
+        self.sqh.insert_many("demo", ["num", "score"], [[1, 0.5], [2.5, None], [3, "x"]])
+        result = self.sqh.select_columns("demo", [self.num, self.score], order_by="num", chunk_size=1, use_numpy=False)
+        self.assertEqual(result["num"].values, [1, 2.5, 3])
+        self.assertEqual(result["score"].values, [0.5, 0, "x"])
+        self.assertEqual(result["score"].mask, array.array("b", [0, 1, 0]))
+
+    @unittest.skipIf(load_numpy() is None, "numpy is not installed")
+    def test_numpy(self):
+        numpy = load_numpy()
+        nums = numpy.arange(1000, dtype=numpy.int64)
+        scores = nums * 0.5
+        mask = nums % 10 == 0
+        self.sqh.insert_columns("demo", [self.num, self.score], [nums, scores], [None, mask], chunk_size=300)
+        result = self.sqh.select_columns("demo", [self.num, self.score], order_by="num", chunk_size=300)
+        self.assertTrue((result["num"].values == nums).all())
+        self.assertTrue((result["score"].mask == mask).all())
+        self.assertTrue((result["score"].values[~mask] == scores[~mask]).all())
+
+
+class AggregateTestCase(TestCase):
+
+    def setUp(self):
+        self.sqh = Sqlite3Worker()
+        self.cls = Column("cls", DataType.TEXT)
+        self.name = Column("name", DataType.TEXT)
+        self.grade = Column("grade", DataType.REAL)
+        self.sqh.create_table("students", [self.cls, self.name, self.grade])
+        self.sqh.insert_many("students", [self.cls, self.name, self.grade], [
+            ["a", "Tom", 90.0], ["a", "Amy", 80.0], ["b", "Bob", 70.0], ["b", "Liz", None], ["c", "Joe", 60.0],
+        ])
+
+    def test_functions(self):
+        self.assertEqual(Aggregate.count(), "count(*)")
+        self.assertEqual(Aggregate.count(self.cls, distinct=True, alias="n"), "count(DISTINCT cls) AS n")
+        self.assertEqual(Aggregate.group_concat(self.name, "; "), "group_concat(name, '; ')")
+        self.assertRaises(ValueError, Aggregate.group_concat, self.name, ",", True)
+
+        _, rows = self.sqh.select("students", [Aggregate.count(), Aggregate.count(self.grade), Aggregate.sum(self.grade),
+                                               Aggregate.avg(self.grade), Aggregate.min(self.grade),
+                                               Aggregate.max(self.grade)])
+        self.assertEqual(rows, [[5, 4, 300.0, 75.0, 60.0, 90.0]])
+
+    def test_group_by(self):
+        having = Operand(Aggregate.count()).greater_than(1)
+        statement, rows = self.sqh.select(
+            "students", [self.cls, Aggregate.avg(self.grade, alias="mean"), Aggregate.group_concat(self.name, alias="names")],
+            where=self.sqh.operand(self.name).equal_to("Amy", not_=True),
+            group_by=self.cls, having=having, order_by="cls", row_type="dict")
+        self.assertEqual(statement, "SELECT cls, avg(grade) AS mean, group_concat(name) AS names FROM students "
+                                    "WHERE name != ? GROUP BY cls HAVING count(*) > ? ORDER BY cls;")
+        self.assertEqual(rows, [{"cls": "b", "mean": 70.0, "names": "Bob,Liz"}])
+
+        statement, _ = self.sqh.select("students", [self.cls, Aggregate.max(self.grade)], group_by=[self.cls],
+                                       having=Operand(Aggregate.max(self.grade)).greater_than(65), limit=2,
+                                       execute=False)
+        self.assertEqual(statement, "SELECT cls, max(grade) FROM students GROUP BY cls HAVING max(grade) > 65 LIMIT 2;")
+        _, rows = self.sqh.select("students", [self.cls, Aggregate.max(self.grade)], group_by=self.cls,
+                                  having=Operand(Aggregate.max(self.grade)).greater_than(65), limit=1, offset=1)
+        self.assertEqual(rows, [["b", 70.0]])
+        self.assertRaises(ValueError, self.sqh.select, "students", [self.cls], having=having)
+
+    def test_count_exists(self):
+        self.assertEqual(self.sqh.count("students"), 5)
+        self.assertEqual(self.sqh.count("students", self.sqh.operand(self.cls).equal_to("a")), 2)
+        self.assertTrue(self.sqh.exists("students", self.sqh.operand(self.grade).is_null()))
+        self.assertFalse(self.sqh.exists("students", self.sqh.operand(self.cls).equal_to("d")))
+
+
+class ImportExportTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.num = Column("num", DataType.INTEGER, nullable=False)
+        self.name = Column("name", DataType.TEXT)
+        self.score = Column("score", DataType.REAL)
+        self.data = Column("data", DataType.BLOB, secure=True)
+        self.columns = [self.num, self.name, self.score, self.data]
+        self.sqh.create_table("demo", self.columns)
+        self.sqh.create_table("copy", self.columns)
+
+    def test_csv(self):
+        reports = []
+        src = io.StringIO("data,score,num,name\n0a0b,1.5,1,Alice\n,,2,Bob\n,3,3,Carol\n")
+        report = self.sqh.import_csv(src, "demo", self.columns, batch_size=2, progress=reports.append)
+        self.assertEqual(report.rows, 3)
+        self.assertEqual([r.rows for r in reports], [2, 3])
+        _, rows = self.sqh.select("demo", self.columns, order_by="num")
+        self.assertEqual(rows, [[1, "Alice", 1.5, b"\x0a\x0b"], [2, "Bob", None, None], [3, "Carol", 3.0, None]])
+        if has_crypto():
+            _, raw = self.sqh.select("demo", ["data"], order_by="num")
+            self.assertNotEqual(raw[0][0], b"\x0a\x0b")
+
+        dst = io.StringIO()
+        self.sqh.export_csv(dst, "demo", self.columns, order_by="num", chunk_size=2)
+        self.assertEqual(dst.getvalue().splitlines(), [
+            "num,name,score,data", "1,Alice,1.5,0a0b", "2,Bob,,", "3,Carol,3.0,",
+        ])
+
+        self.assertRaises(ValueError, self.sqh.import_csv, io.StringIO("num\n1\n"), "demo", self.columns)
+
+    def test_jsonl(self):
+        self.sqh.insert_many("demo", self.columns, [[i, f"n{i}", i / 2, bytes([i])] for i in range(5)])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "demo.jsonl")
+            report = self.sqh.export_jsonl(path, "demo", self.columns, where=self.sqh.operand(self.num).greater_than(0))
+            self.assertEqual(report.rows, 4)
+            with self.sqh.transaction():
+                self.sqh.import_jsonl(path, "copy", self.columns, batch_size=3)
+        _, rows = self.sqh.select("copy", self.columns, order_by="num")
+        self.assertEqual(rows, [[i, f"n{i}", i / 2, bytes([i])] for i in range(1, 5)])
+
+
+class ResultCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.cache = ResultCache(max_rows=10)
+        self.sqh = Sqlite3Worker(result_cache=self.cache)
+        self.num = Column("num", DataType.INTEGER)
+        self.sqh.create_table("demo", [self.num])
+        self.sqh.insert_many("demo", [self.num], [[i] for i in range(5)])
+
+    def select(self, limit: int = None):
+        return self.sqh.select("demo", [self.num], order_by="num", limit=limit)[1]
+
+    def test_hit_and_invalidate(self):
+        self.assertEqual(self.select(), [[i] for i in range(5)])
+        rows = self.select()
+        rows.append([99])
+        self.assertEqual(self.select(), [[i] for i in range(5)])
+        info = self.sqh.result_cache_info()
+        self.assertEqual((info.hits, info.misses, info.entries, info.rows), (2, 1, 1, 5))
+        self.assertAlmostEqual(info.hit_rate, 2 / 3)
+
+        self.sqh.insert_into("demo", [self.num], [[5]])
+        self.assertEqual(len(self.select()), 6)
+        self.sqh.delete_from("demo", self.sqh.operand(self.num).greater_than(3))
+        self.assertEqual(len(self.select()), 4)
+        self.sqh.update("demo", [(self.num, 0)], self.sqh.operand(self.num).equal_to(3))
+        self.assertEqual(self.select()[-1], [2])
+
+        self.sqh.rename_table("demo", "demo2")
+        self.assertRaises(Exception, self.select)
+        self.assertEqual(self.sqh.show_tables(), ["demo2"])
+
+    def test_mutate_rows(self):
+        rows = self.select()
+        rows[0][0] = 99
+        rows[1].append(99)
+        self.assertEqual(self.select(), [[i] for i in range(5)])
+        self.select()[0][0] = 99
+        self.assertEqual(self.select(), [[i] for i in range(5)])
+
+        _, rows = self.sqh.select("demo", [self.num], order_by="num", row_type="dict")
+        rows[0]["num"] = 99
+        _, rows = self.sqh.select("demo", [self.num], order_by="num", row_type="dict")
+        self.assertEqual(rows[0], {"num": 0})
+        self.assertEqual(self.sqh.result_cache_info().hits, 4)
+
+    def test_transaction(self):
+        self.select()
+        try:
+            with self.sqh.transaction():
+                self.sqh.insert_many("demo", [self.num], [[7]])
+                self.assertEqual(len(self.select()), 6)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(len(self.select()), 5)
+
+    def test_limit(self):
+        self.select()
+        self.select(limit=3)
+        self.select(limit=4)
+        self.assertEqual(self.cache.info().rows, 7)
+        self.assertEqual(self.cache.info().entries, 2)
+
+        cache = ResultCache(max_rows=10, ttl=0.01)
+        cache.put("k", ["demo"], [[1]], cache.generation)
+        self.assertEqual(cache.get("k"), [[1]])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("k"))
+        # 查询期间表被清除过，结果不放入缓存
+        generation = cache.generation
+        cache.invalidate("other")
+        cache.put("k", ["demo"], [[1]], generation)
+        self.assertIsNone(cache.get("k"))
+        self.assertRaises(ValueError, ResultCache)
+
+
+@unittest.skipIf(not hasattr(sqlite3.Connection, "blobopen"), "blobopen requires python 3.11")
+class BlobStreamTestCase(TestCase):
+
+    def setUp(self):
+        self.key = b'a5ohpollt_86HP8zgL3v4ad7pBFvDEW7gWWJqWIBkX8='
+        self.sqh = Sqlite3Worker(key=self.key)
+        self.name = Column("name", DataType.TEXT)
+        self.doc = Column("doc", DataType.BLOB)
+        self.secure_doc = Column("secure_doc", DataType.BLOB, secure=True)
+        self.sqh.create_table("docs", [self.name, self.doc, self.secure_doc])
+        self.payload = os.urandom(100000)
+
+    def test_stream(self):
+        rowid = self.sqh.insert_blob("docs", self.doc, io.BytesIO(self.payload), [self.name], ["a"], chunk_size=4096)
+        _, rows = self.sqh.select("docs", [self.name, self.doc])
+        self.assertEqual(rows, [["a", self.payload]])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "doc.bin")
+            self.assertEqual(self.sqh.read_blob("docs", self.doc, rowid, path, chunk_size=4096), len(self.payload))
+            rowid2 = self.sqh.insert_blob("docs", "doc", path)
+        self.assertEqual(self.sqh.select("docs", [self.doc], self.sqh.operand("rowid").equal_to(rowid2))[1],
+                         [[self.payload]])
+
+        with self.sqh.open_blob("docs", self.doc, rowid, readonly=False) as blob:
+            blob.seek(10)
+            blob.write(b"xyz")
+        with self.sqh.open_blob("docs", self.doc, rowid) as blob:
+            blob.seek(10)
+            self.assertEqual(blob.read(3), b"xyz")
+            self.assertEqual(len(blob), len(self.payload))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self.sqh.insert_blob, "docs", self.secure_doc, io.BytesIO(b"a"))
+        self.assertRaises(ValueError, self.sqh.open_blob, "docs", self.name, 1)
+        # 数据不够时整行回滚
+        self.assertRaises(ValueError, self.sqh.insert_blob, "docs", self.doc, io.BytesIO(b"abc"), size=10)
+        self.assertEqual(self.sqh.select("docs", [self.doc])[1], [])
+
+
+class LazyImportTestCase(TestCase):
+
+    def test_lazy_modules(self):
+        code = ("import sys, Sqlite3Helper; from Sqlite3Helper import *; "
+                "print(sorted(m for m in ('cryptography', 'asyncio', 'multiprocessing', 'logging', 'threading', "
+                "'concurrent.futures', 'csv', 'json', 'Sqlite3Helper._pool', 'Sqlite3Helper._shard') "
+                "if m in sys.modules)); "
+                "Sqlite3Helper.Sqlite3Worker(); print('cryptography' in sys.modules); "
+                "print(Sqlite3Helper.AsyncSqlite3Worker.__name__, Sqlite3Helper.Sqlite3WorkerPool.__name__, "
+                "Sqlite3Helper.ShardedSqlite3Worker.__name__, Sqlite3Helper.TransferReport.__name__); ")
+        expected = ["[]", "False", "AsyncSqlite3Worker", "Sqlite3WorkerPool", "ShardedSqlite3Worker", "TransferReport"]
+        # 没有安装 cryptography 时只检查按需导入，不检查加密
+        if has_crypto():
+            code += ("Sqlite3Helper.Sqlite3Worker(key=Sqlite3Helper.generate_key_and_stuff()[0]); "
+                     "print('cryptography' in sys.modules)")
+            expected.append("True")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, check=True,
+                                capture_output=True, text=True).stdout
+        self.assertEqual(output.split(), expected)
+
+
 class OperandTestCase(TestCase):
 
     def setUp(self):
@@ -169,6 +1260,58 @@ class OperandTestCase(TestCase):
         o5 = Operand(col_data).in_(["John", 10, self.b])
         self.assertEqual(str(o5), "data IN (X'4a6f686e', 10, X'68656c6c6f')")
 
+    def test_params(self):
+        col_name = Column("name", DataType.TEXT)
+        col_age = Column("age", DataType.INTEGER)
+        e1 = Operand(col_name).equal_to("O'liver").and_(Operand(col_age).between(10, 20))
+        self.assertEqual(e1.sql, "name = ? AND age BETWEEN ? AND ?")
+        self.assertEqual(e1.params, ["O'liver", 10, 20])
+        self.assertEqual(str(e1), "name = 'O''liver' AND age BETWEEN 10 AND 20")
+
+        e2 = Operand(col_age).in_([1, 2, 3], not_=True).or_(Expression("age IS NULL"), high_priority=True)
+        self.assertEqual(e2.sql, "(age NOT IN (?, ?, ?) OR age IS NULL)")
+        self.assertEqual(e2.params, [1, 2, 3])
+
+        e3 = Operand(col_name).like("J%", escape="\\").exists()
+        self.assertEqual(e3.sql, "EXISTS (name LIKE ? ESCAPE ?)")
+        self.assertEqual(str(e3), "EXISTS (name LIKE 'J%' ESCAPE '\\')")
+
+        e4 = Expression("age > ?", [3])
+        self.assertEqual(str(e4), "age > 3")
+        self.assertEqual(Expression("name = '?'").sql, "name = '?'")
+        self.assertRaises(ValueError, Expression, "age > ?", [])
+
+    def test_fernet_cache(self):
+        col_data = Column("data", DataType.BLOB, secure=True)
+        op = Operand(col_data, self.key, self.time, self.iv)
+        e1 = op.in_(["a", "b", "c"])
+        self.assertIs(op._get_fernet(), get_fernet(self.key, self.time, self.iv))
+        self.assertIs(Operand(col_data, self.key, self.time, self.iv)._get_fernet(), op._get_fernet())
+
+        sqh = Sqlite3Worker(key=self.key, fix_time=self.time, fix_iv=self.iv)
+        e2 = sqh.operand(col_data).in_(["a", "b", "c"])
+        self.assertEqual(e1.params, e2.params)
+        self.assertIs(sqh.operand(col_data)._get_fernet(), sqh._fernet)
+        # 没有密钥的时候不加密
+        self.assertEqual(Sqlite3Worker().operand(col_data).equal_to("a").params, [b"a"])
+
+    def test_execute(self):
+        sqh = Sqlite3Worker(key=self.key, fix_time=self.time, fix_iv=self.iv)
+        col_name = Column("name", DataType.TEXT)
+        col_data = Column("data", DataType.BLOB, secure=True)
+        sqh.create_table("demo", [col_name, col_data])
+        sqh.insert_many("demo", [col_name, col_data], [[f"n{i}", f"d{i}"] for i in range(100)])
+
+        for i in range(5):
+            cond = Operand(col_data, self.key, self.time, self.iv).equal_to(f"d{i}")
+            _, rows = sqh.select("demo", [col_name, col_data], where=cond)
+            self.assertEqual(rows, [[f"n{i}", f"d{i}".encode()]])
+        self.assertEqual(sqh.statement_cache_info().misses, 1)
+
+        cond = Operand(col_name).in_([f"n{i}" for i in range(50)])
+        sqh.delete_from("demo", where=cond)
+        self.assertEqual(len(sqh.select("demo", [col_name])[1]), 50)
+
 
 class TestMain(TestCase):
 
@@ -193,6 +1336,15 @@ class TestMain(TestCase):
         self.assertEqual(to_string(1), "1")
         self.assertEqual(to_string(1.0), "1.0")
 
+    def test_to_param(self):
+        self.assertEqual(to_param("Hello"), "Hello")
+        self.assertEqual(to_param("'He''llo'"), "He'llo")
+        self.assertEqual(to_param("'"), "'")
+        self.assertIsNone(to_param(None))
+        self.assertIsNone(to_param(NullType()))
+        self.assertEqual(to_param(BlobType(b"hello")), b"hello")
+        self.assertEqual(to_param(1.0), 1.0)
+
     def test_expression(self):
         e1 = Expression("A")
         e2 = Expression("B")